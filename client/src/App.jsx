@@ -1,5 +1,5 @@
 import React from "react";
-import { Container, Typography, Box, Grid, Alert, ThemeProvider, CssBaseline, createTheme, Stack } from "@mui/material";
+import { Container, Typography, Box, Grid, Alert, ThemeProvider, CssBaseline, createTheme, Stack, LinearProgress } from "@mui/material";
 import { SearchOff, WifiTethering, Hub } from "@mui/icons-material";
 import { motion, AnimatePresence } from "framer-motion";
 
@@ -34,7 +34,7 @@ const darkTheme = createTheme({
 });
 
 export default function App() {
-  const { leads, loading, error, searchLeads } = useLeadSearch();
+  const { leads, loading, error, progress, searchLeads } = useLeadSearch();
 
   return (
     <ThemeProvider theme={darkTheme}>
@@ -110,6 +110,24 @@ export default function App() {
             )}
           </AnimatePresence>
 
+          {progress && progress.limit > 0 && (
+            <Box sx={{ mb: 4 }}>
+              <Stack direction="row" justifyContent="space-between" sx={{ mb: 1 }}>
+                <Typography variant="caption" sx={{ color: "#00f2ff", fontFamily: "monospace", letterSpacing: "2px" }}>
+                  {progress.done ? "STREAM COMPLETE" : "STREAMING LEADS"}
+                </Typography>
+                <Typography variant="caption" sx={{ color: "rgba(255,255,255,0.5)", fontFamily: "monospace" }}>
+                  {progress.returned} / {progress.limit}
+                </Typography>
+              </Stack>
+              <LinearProgress
+                variant="determinate"
+                value={Math.min(100, (progress.returned / progress.limit) * 100)}
+                sx={{ height: 4, borderRadius: 2, backgroundColor: "rgba(0, 242, 255, 0.1)", "& .MuiLinearProgress-bar": { backgroundColor: "#00f2ff" } }}
+              />
+            </Box>
+          )}
+
           <Grid container spacing={3}>
             <AnimatePresence>
               {leads.map((lead, index) => (
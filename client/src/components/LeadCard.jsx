@@ -36,6 +36,8 @@ export const LeadCard = ({ lead, index }) => {
   // Logica: 
   // - Directory Only = Warning (Giallo)
   // - No Website = Danger (Rosso - Alta priorità per vendita sito)
+  // - Dead Website = Danger (Rosso - Sito indicato ma non raggiungibile)
+  // - Outdated Website = Warning (Giallo - Niente HTTPS o non mobile)
   // - Has Website = Success/Primary (Azzurro - Magari per servizi SEO)
   let statusColor = THEME.primary;
   let StatusIcon = Business;
@@ -43,9 +45,11 @@ export const LeadCard = ({ lead, index }) => {
   if (lead.current_status === "Directory Only") {
     statusColor = THEME.warning;
     StatusIcon = VerifiedUser;
-  } else if (lead.current_status === "No Website") {
+  } else if (lead.current_status === "No Website" || lead.current_status === "Dead Website") {
     statusColor = THEME.danger;
     StatusIcon = GppBad;
+  } else if (lead.current_status === "Outdated Website") {
+    statusColor = THEME.warning;
   }
 
   return (
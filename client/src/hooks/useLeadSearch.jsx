@@ -1,25 +1,39 @@
 import { useState } from "react";
 
+const API_BASE = "https://imprese-2.onrender.com";
+
 export const useLeadSearch = () => {
   const [leads, setLeads] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [progress, setProgress] = useState(null);
+
+  const handleEvent = (event) => {
+    if (event.type === "lead") {
+      setLeads((prev) => [...prev, event.lead]);
+    } else if (event.type === "progress" || event.type === "end") {
+      setProgress({ returned: event.returned, limit: event.limit, done: event.type === "end" });
+    } else if (event.type === "error") {
+      setError(event.error || "Errore durante lo streaming.");
+    }
+  };
 
   const searchLeads = async (filters) => {
     setLoading(true);
     setError(null);
     setLeads([]);
+    setProgress(null);
 
     try {
       const params = new URLSearchParams({
         country: filters.country,
         city: filters.city,
         limit: filters.limit.toString(),
-        category: filters.category 
+        category: filters.category
       });
 
       const response = await fetch(
-        `https://imprese-2.onrender.com/api/v1/leads?${params.toString()}`,
+        `${API_BASE}/api/v1/leads/stream?${params.toString()}`,
       );
 
       if (!response.ok) {
@@ -27,8 +41,26 @@ export const useLeadSearch = () => {
         throw new Error(`Errore Server: ${response.status}`);
       }
 
-      const data = await response.json();
-      setLeads(data);
+      // NDJSON: one event per line, rendered as soon as it arrives
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let newline;
+        while ((newline = buffer.indexOf("\n")) >= 0) {
+          const line = buffer.slice(0, newline).trim();
+          buffer = buffer.slice(newline + 1);
+          if (line) handleEvent(JSON.parse(line));
+        }
+      }
+
+      const rest = (buffer + decoder.decode()).trim();
+      if (rest) handleEvent(JSON.parse(rest));
     } catch (err) {
       setError(err.message);
     } finally {
@@ -36,5 +68,5 @@ export const useLeadSearch = () => {
     }
   };
 
-  return { leads, loading, error, searchLeads };
+  return { leads, loading, error, progress, searchLeads };
 };
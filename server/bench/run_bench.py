@@ -0,0 +1,261 @@
+"""
+Offline load test for /api/v1/leads: no SerpAPI or Gemini quota is used.
+
+Starts the stub SerpAPI app and main.app with uvicorn on local ports, swaps the Gemini model
+for StubGeminiModel, fires concurrent /api/v1/leads requests and reports latency percentiles,
+throughput and upstream call counts. Results are written as JSON; pass --baseline to compare.
+
+    cd server
+    python bench/run_bench.py --requests 60 --concurrency 8 --label before
+    python bench/run_bench.py --requests 60 --concurrency 8 --label after --baseline bench/results/before.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import itertools
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, SERVER_DIR)
+
+import httpx
+import uvicorn
+
+from stubs import StubGeminiModel, make_serp_app
+
+DEFAULT_CITIES = ["Milano", "Roma", "Torino", "Napoli", "Bologna", "Firenze"]
+DEFAULT_CATEGORIES = ["Bar", "Ristorante", "Parrucchiere", "Idraulico", "Palestra", "Pizzeria"]
+
+# compared against --baseline; True means higher is better
+COMPARED = {
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "rps": True,
+    "errors": False,
+    "upstream.serp.calls": False,
+    "upstream.gemini.calls": False,
+    "fallback_pitches": False,
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def _serve_in_thread(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 15
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError(f"server on port {port} did not start")
+        time.sleep(0.05)
+    return server
+
+def _prepare_env(args, serp_port: int, workdir: str) -> None:
+    os.environ["SERPAPI_BASE_URL"] = f"http://127.0.0.1:{serp_port}"
+    os.environ.setdefault("SERPAPI_API_KEY", "bench")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["SERP_CACHE_BACKEND"] = args.cache
+    os.environ["PITCH_CACHE_BACKEND"] = args.cache
+    os.environ["SERP_CACHE_PATH"] = os.path.join(workdir, "serp_cache.sqlite3")
+    os.environ["PITCH_CACHE_PATH"] = os.path.join(workdir, "pitch_cache.sqlite3")
+    os.environ["LEAD_STORE_PATH"] = os.path.join(workdir, "leads.sqlite3")
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+    os.environ["WEBSITE_PROBE_CACHE_PATH"] = os.path.join(workdir, "website_probe.sqlite3")
+    # no cached model choice from a real run, so startup goes through the stub init_model
+    os.environ["GEMINI_MODEL_CACHE_PATH"] = os.path.join(workdir, "gemini_model.json")
+    # stub websites do not exist; probing them would only measure DNS failures
+    os.environ.setdefault("WEBSITE_PROBE", "0")
+    if not args.real_limits:
+        # measure the pipeline, not the production quota settings
+        for k, v in {"GEMINI_RATE_PER_MIN": "100000", "GEMINI_BURST": "1000",
+                     "SERPAPI_RATE_PER_MIN": "100000", "SERPAPI_BURST": "1000"}.items():
+            os.environ.setdefault(k, v)
+
+def _install_stub_model(main, model: StubGeminiModel) -> None:
+    async def init_model(validate: bool = False) -> None:
+        main._MODEL_OBJ = model
+        main._MODEL_NAME = "stub-gemini"
+        main._MODEL_OUTPUT_LIMIT = 8192
+    main.init_model = init_model
+
+def _scrape_counter(metrics_text: str, name: str) -> float:
+    total = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith(name + "{") or line.startswith(name + " "):
+            try:
+                total += float(line.rsplit(" ", 1)[1])
+            except ValueError:
+                pass
+    return total
+
+async def _drive(base_url: str, args) -> Dict[str, Any]:
+    cities = args.cities.split(",")
+    categories = args.categories.split(",")
+    combos = list(itertools.product(cities, categories))[: max(1, args.distinct)]
+    plan = [combos[k % len(combos)] for k in range(args.requests)]
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    leads_returned: List[int] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        async def worker():
+            while True:
+                try:
+                    city, category = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                params = {"city": city, "category": category, "limit": args.limit, "ai": args.ai,
+                          "include_with_website": args.include_with_website}
+                t0 = time.perf_counter()
+                try:
+                    r = await client.get("/api/v1/leads", params=params)
+                    key = str(r.status_code)
+                    if r.status_code == 200:
+                        leads_returned.append(len(r.json()))
+                except Exception as e:
+                    key = type(e).__name__
+                latencies.append((time.perf_counter() - t0) * 1000)
+                statuses[key] = statuses.get(key, 0) + 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall_s = time.perf_counter() - t_start
+        metrics_text = (await client.get("/metrics")).text
+
+    lat = sorted(latencies)
+    return {
+        "wall_s": round(wall_s, 3),
+        "rps": round(len(lat) / wall_s, 3) if wall_s > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(lat, 0.50), 1),
+            "p95": round(_percentile(lat, 0.95), 1),
+            "p99": round(_percentile(lat, 0.99), 1),
+            "max": round(lat[-1], 1) if lat else 0.0,
+            "mean": round(sum(lat) / len(lat), 1) if lat else 0.0,
+        },
+        "statuses": statuses,
+        "errors": sum(v for k, v in statuses.items() if k != "200"),
+        "leads_returned_mean": round(sum(leads_returned) / len(leads_returned), 1) if leads_returned else 0.0,
+        "fallback_pitches": _scrape_counter(metrics_text, "lead_gen_fallback_pitches_total"),
+    }
+
+def _get_path(d: Dict[str, Any], dotted: str) -> Optional[float]:
+    cur: Any = d
+    for part in dotted.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return None
+        cur = cur[part]
+    return cur if isinstance(cur, (int, float)) else None
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> bool:
+    """Prints a delta table; returns False when a latency/throughput metric regressed past threshold."""
+    ok = True
+    print(f"\n{'metric':<26}{'baseline':>12}{'current':>12}{'delta':>10}")
+    for path, higher_is_better in COMPARED.items():
+        b, c = _get_path(baseline, path), _get_path(current, path)
+        if b is None or c is None:
+            continue
+        delta = (c - b) / b if b else (0.0 if c == b else float("inf"))
+        worse = delta < -threshold if higher_is_better else delta > threshold
+        flag = "  REGRESSION" if worse and (path.startswith("latency") or path == "rps") else ""
+        if flag:
+            ok = False
+        shown = f"{delta * 100:>9.1f}%" if delta != float("inf") else f"{'new':>10}"
+        print(f"{path:<26}{b:>12g}{c:>12g}{shown}{flag}")
+    return ok
+
+def main_cli() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--distinct", type=int, default=1000, help="number of distinct city/category pairs in the mix")
+    ap.add_argument("--cities", default=",".join(DEFAULT_CITIES))
+    ap.add_argument("--categories", default=",".join(DEFAULT_CATEGORIES))
+    ap.add_argument("--ai", type=lambda s: s.lower() in {"1", "true", "yes"}, default=True)
+    ap.add_argument("--include-with-website", dest="include_with_website", action="store_true")
+    ap.add_argument("--cache", default="off", help="SERP/pitch cache backend during the run (off|memory|sqlite)")
+    ap.add_argument("--real-limits", action="store_true", help="keep the configured upstream rate limits")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--serp-latency-ms", type=float, default=400)
+    ap.add_argument("--serp-jitter-ms", type=float, default=200)
+    ap.add_argument("--serp-page-size", type=int, default=20)
+    ap.add_argument("--serp-pages", type=int, default=4)
+    ap.add_argument("--serp-429-rate", type=float, default=0.0)
+    ap.add_argument("--gemini-latency-ms", type=float, default=1200)
+    ap.add_argument("--gemini-jitter-ms", type=float, default=300)
+    ap.add_argument("--gemini-per-item-ms", type=float, default=60)
+    ap.add_argument("--gemini-429-rate", type=float, default=0.0)
+    ap.add_argument("--gemini-malformed-rate", type=float, default=0.0)
+    ap.add_argument("--label", default=time.strftime("%Y%m%d-%H%M%S"))
+    ap.add_argument("--out-dir", default=os.path.join(HERE, "results"))
+    ap.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    ap.add_argument("--fail-threshold", type=float, default=0.10, help="relative regression that fails the run")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="leadbench-")
+    serp_app = make_serp_app(
+        latency_ms=args.serp_latency_ms, jitter_ms=args.serp_jitter_ms, page_size=args.serp_page_size,
+        max_pages=args.serp_pages, rate_429=args.serp_429_rate,
+    )
+    serp_port = _serve_in_thread(serp_app, _free_port()).config.port
+    _prepare_env(args, serp_port, workdir)
+
+    t_import = time.perf_counter()
+    import main
+    import_ms = round((time.perf_counter() - t_import) * 1000, 1)
+    model = StubGeminiModel(
+        latency_ms=args.gemini_latency_ms, jitter_ms=args.gemini_jitter_ms, per_item_ms=args.gemini_per_item_ms,
+        rate_429=args.gemini_429_rate, malformed_rate=args.gemini_malformed_rate,
+    )
+    _install_stub_model(main, model)
+    app_server = _serve_in_thread(main.app, _free_port())
+
+    result = asyncio.run(_drive(f"http://127.0.0.1:{app_server.config.port}", args))
+    app_server.should_exit = True
+
+    result["upstream"] = {"serp": serp_app.state.counters.snapshot(), "gemini": model.stats()}
+    result["import_ms"] = import_ms
+    result["label"] = args.label
+    result["config"] = {k: v for k, v in vars(args).items() if k not in {"baseline", "out_dir", "label"}}
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    out_path = os.path.join(args.out_dir, f"{args.label}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print(json.dumps({k: result[k] for k in ("latency_ms", "rps", "statuses", "upstream", "fallback_pitches")}, indent=2))
+    print(f"saved {out_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(baseline, result, args.fail_threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,188 @@
+"""
+Local stand-ins for the two upstreams used by main.py, for offline benchmarks.
+
+- make_serp_app(): a FastAPI app serving GET /search.json in the SerpAPI google_maps shape.
+- StubGeminiModel: implements generate_content_async(prompt, stream=...) like genai.GenerativeModel.
+
+Both support fixed latency plus jitter, 429 injection and (Gemini) malformed output, and
+count every call so the load driver can report upstream usage.
+"""
+import json
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+def _stable_int(*parts: Any) -> int:
+    return int(hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:8], 16)
+
+class UpstreamCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def inc(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+def make_serp_app(
+    latency_ms: float = 400,
+    jitter_ms: float = 200,
+    page_size: int = 20,
+    max_pages: int = 4,
+    last_page_size: int = 7,
+    rate_429: float = 0.0,
+    website_ratio: float = 0.4,
+    directory_ratio: float = 0.15,
+    seed: int = 7,
+) -> FastAPI:
+    """
+    Results are deterministic per (q, start) so repeated queries look like the real API;
+    only latency and 429s are random.
+    """
+    app = FastAPI()
+    app.state.counters = UpstreamCounters()
+    rnd = random.Random(seed)
+
+    @app.get("/search.json")
+    async def search(q: str = Query(""), start: int = Query(0)):
+        counters: UpstreamCounters = app.state.counters
+        counters.inc("calls")
+        await asyncio.sleep(max(0.0, latency_ms + rnd.uniform(-jitter_ms, jitter_ms)) / 1000.0)
+        if rate_429 and rnd.random() < rate_429:
+            counters.inc("429")
+            return JSONResponse({"error": "Too many requests"}, status_code=429, headers={"Retry-After": "2"})
+
+        page = start // max(1, page_size)
+        if page >= max_pages:
+            return {"local_results": []}
+        n = last_page_size if page == max_pages - 1 else page_size
+        results = []
+        for i in range(n):
+            h = _stable_int(q, start, i)
+            kind = (h % 1000) / 1000.0
+            if kind < directory_ratio:
+                website = f"https://www.facebook.com/biz{h % 100000}"
+            elif kind < directory_ratio + website_ratio:
+                website = f"https://www.biz{h % 100000}.it"
+            else:
+                website = None
+            results.append({
+                "position": start + i + 1,
+                "title": f"{q.split(' in ')[0]} {h % 100000}",
+                "address": f"Via Roma {h % 300}, {q.split(' in ')[-1]}",
+                "phone": f"+39 02 {h % 10000000:07d}",
+                "website": website,
+                "rating": round(3 + (h % 20) / 10, 1),
+            })
+        counters.inc("results", n)
+        return {"search_metadata": {"status": "Success"}, "local_results": results}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.counters.snapshot()
+
+    return app
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class _StubStream:
+    def __init__(self, text: str, chunk_chars: int, chunk_delay_s: float):
+        self._text = text
+        self._chunk_chars = max(1, chunk_chars)
+        self._chunk_delay_s = chunk_delay_s
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for k in range(0, len(self._text), self._chunk_chars):
+            if self._chunk_delay_s:
+                await asyncio.sleep(self._chunk_delay_s)
+            yield _StubResponse(self._text[k:k + self._chunk_chars])
+
+class StubGeminiModel:
+    """
+    Answers the pitch prompt built by main.py: reads the payload after "Input JSON:" and returns
+    one {"i", "sales_pitch"} object per item. Total latency is latency_ms + per_item_ms * items.
+    """
+    def __init__(
+        self,
+        latency_ms: float = 1200,
+        jitter_ms: float = 300,
+        per_item_ms: float = 60,
+        rate_429: float = 0.0,
+        malformed_rate: float = 0.0,
+        stream_chunk_chars: int = 200,
+        seed: int = 11,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_item_ms = per_item_ms
+        self.rate_429 = rate_429
+        self.malformed_rate = malformed_rate
+        self.stream_chunk_chars = stream_chunk_chars
+        self.counters = UpstreamCounters()
+        self._rnd = random.Random(seed)
+
+    @staticmethod
+    def _payload(prompt: str) -> List[Dict[str, Any]]:
+        idx = prompt.find("Input JSON:")
+        if idx < 0:
+            return []
+        body = prompt[idx + len("Input JSON:"):].lstrip()
+        try:
+            arr, _ = json.JSONDecoder().raw_decode(body)
+        except ValueError:
+            return []
+        return arr if isinstance(arr, list) else []
+
+    def _render(self, items: List[Dict[str, Any]]) -> str:
+        out = [
+            {"i": it.get("i", k), "sales_pitch": f"Buongiorno {it.get('business_name', '')}, ... Possiamo parlarne per 5 minuti?"}
+            for k, it in enumerate(items)
+        ]
+        return json.dumps(out, ensure_ascii=False)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        items = self._payload(prompt)
+        self.counters.inc("calls")
+        self.counters.inc("items", len(items))
+        total_ms = self.latency_ms + self._rnd.uniform(-self.jitter_ms, self.jitter_ms) + self.per_item_ms * len(items)
+        total_s = max(0.0, total_ms) / 1000.0
+
+        if self.rate_429 and self._rnd.random() < self.rate_429:
+            await asyncio.sleep(min(total_s, 0.2))
+            self.counters.inc("429")
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota). Please retry in 2s.")
+
+        text = self._render(items)
+        if self.malformed_rate and self._rnd.random() < self.malformed_rate:
+            self.counters.inc("malformed")
+            # a truncated array: the kind of output a max_output_tokens cut produces
+            text = "Ecco le email richieste:\n" + text[: max(1, len(text) // 2)]
+
+        if not stream:
+            await asyncio.sleep(total_s)
+            return _StubResponse(text)
+        # time to first token is the fixed part, the rest is spread across chunks
+        await asyncio.sleep(max(0.0, total_s - self.per_item_ms * len(items) / 1000.0))
+        n_chunks = max(1, -(-len(text) // max(1, self.stream_chunk_chars)))
+        return _StubStream(text, self.stream_chunk_chars, self.per_item_ms * len(items) / 1000.0 / n_chunks)
+
+    def stats(self) -> Dict[str, int]:
+        return self.counters.snapshot()
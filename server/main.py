@@ -1,25 +1,47 @@
+import io
 import os
 import re
+import csv
 import time
 import uuid
 import json
+import zlib
+import sqlite3
+import bisect
 import asyncio
+import hashlib
 import logging
-from typing import List, Optional, Dict, Any, Set, Tuple
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import aclosing, nullcontext
+from typing import List, Optional, Dict, Any, Set, Tuple, Callable, Awaitable, AsyncIterator, Deque
 from urllib.parse import urlparse
 
+_BOOT_T0 = time.perf_counter()
+
 import dotenv
 from fastapi import FastAPI, Query, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from serpapi import GoogleSearch
-import google.generativeai as genai
+import httpx
+
+_IMPORT_MS = int((time.perf_counter() - _BOOT_T0) * 1000)
 
 dotenv.load_dotenv()
 
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
+SERPAPI_BASE_URL = (os.getenv("SERPAPI_BASE_URL") or "https://serpapi.com").rstrip("/")
+SERPAPI_TIMEOUT_S = float(os.getenv("SERPAPI_TIMEOUT_S") or "30")
+SERPAPI_MAX_CONNECTIONS = int(os.getenv("SERPAPI_MAX_CONNECTIONS") or "20")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = (os.getenv("GEMINI_MODEL") or "").strip()
+# cached: reuse the model chosen on a previous boot until the TTL expires; validate: always list_models; lazy: pick on first use
+GEMINI_STARTUP = (os.getenv("GEMINI_STARTUP") or "cached").strip().lower()
+GEMINI_MODEL_CACHE_PATH = os.getenv("GEMINI_MODEL_CACHE_PATH") or "gemini_model.json"
+GEMINI_MODEL_CACHE_TTL_S = int(os.getenv("GEMINI_MODEL_CACHE_TTL_S") or str(24 * 3600))
 
 if not SERPAPI_API_KEY or not GEMINI_API_KEY:
     raise RuntimeError("MISSING API KEYS IN .ENV FILE")
@@ -31,15 +53,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger("lead-gen")
 
-genai.configure(api_key=GEMINI_API_KEY)
-
 generation_config = {
     "temperature": 0.7,
     "top_p": 0.95,
     "top_k": 40,
-    "max_output_tokens": 900,
     "response_mime_type": "text/plain",
 }
+# max_output_tokens comes from the selected model's output_token_limit; this only lowers it
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS") or "0")
+# used until the model's limit is known; no generateContent model has a lower one
+GEMINI_DEFAULT_OUTPUT_TOKENS = 2048
+
+SERP_PAGE_SIZE = 20
+SERP_MAX_START = 60
+SERP_MAX_INFLIGHT = max(1, int(os.getenv("SERP_MAX_INFLIGHT") or "4"))
+PITCH_MAX_INFLIGHT = max(1, int(os.getenv("PITCH_MAX_INFLIGHT") or "2"))
+PITCH_BATCH_WINDOW_MS = int(os.getenv("PITCH_BATCH_WINDOW_MS") or "100")
+PITCH_BATCH_MAX_ITEMS = max(1, int(os.getenv("PITCH_BATCH_MAX_ITEMS") or "20"))
+
+GEMINI_RATE_PER_MIN = float(os.getenv("GEMINI_RATE_PER_MIN") or "15")
+GEMINI_BURST = int(os.getenv("GEMINI_BURST") or "3")
+GEMINI_LIMITER_MAX_WAIT_S = float(os.getenv("GEMINI_LIMITER_MAX_WAIT_S") or "10")
+SERPAPI_RATE_PER_MIN = float(os.getenv("SERPAPI_RATE_PER_MIN") or "120")
+SERPAPI_BURST = int(os.getenv("SERPAPI_BURST") or "10")
+SERPAPI_LIMITER_MAX_WAIT_S = float(os.getenv("SERPAPI_LIMITER_MAX_WAIT_S") or "10")
+
+PITCH_TOKENS_PER_ITEM = int(os.getenv("PITCH_TOKENS_PER_ITEM") or "320")
+PITCH_TOKEN_BUDGET_RATIO = float(os.getenv("PITCH_TOKEN_BUDGET_RATIO") or "0.85")
+PITCH_CHUNK_CONCURRENCY = max(1, int(os.getenv("PITCH_CHUNK_CONCURRENCY") or "3"))
+GEMINI_STREAM = (os.getenv("GEMINI_STREAM") or "1").strip().lower() in {"1", "true", "yes", "on"}
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH") or "jobs.sqlite3"
+LEAD_STORE_PATH = os.getenv("LEAD_STORE_PATH") or "leads.sqlite3"
+
+DIRECTORY_DOMAINS_FILE = os.getenv("DIRECTORY_DOMAINS_FILE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "directory_domains.txt")
+PUBLIC_SUFFIX_FILE = os.getenv("PUBLIC_SUFFIX_FILE") or None
+DOMAIN_LIST_RELOAD_S = float(os.getenv("DOMAIN_LIST_RELOAD_S") or "30")
+DOMAIN_MEMO_SIZE = int(os.getenv("DOMAIN_MEMO_SIZE") or "50000")
+JOBS_CONCURRENCY = max(1, int(os.getenv("JOBS_CONCURRENCY") or "2"))
+JOB_MAX_LIMIT = int(os.getenv("JOB_MAX_LIMIT") or "1000")
+JOB_MAX_CATEGORIES = int(os.getenv("JOB_MAX_CATEGORIES") or "20")
+JOB_MAX_START = int(os.getenv("JOB_MAX_START") or "120")
+JOB_FETCH_RETRIES = int(os.getenv("JOB_FETCH_RETRIES") or "5")
+JOB_FETCH_BACKOFF_MAX_S = float(os.getenv("JOB_FETCH_BACKOFF_MAX_S") or "60")
+EXPORT_CONCURRENCY = max(1, int(os.getenv("EXPORT_CONCURRENCY") or "4"))
+EXPORT_MAX_CITIES = int(os.getenv("EXPORT_MAX_CITIES") or "50")
+EXPORT_MAX_CATEGORIES = int(os.getenv("EXPORT_MAX_CATEGORIES") or "10")
+EXPORT_MAX_PER_SEARCH = int(os.getenv("EXPORT_MAX_PER_SEARCH") or "60")
+
+SERP_CACHE_BACKEND = (os.getenv("SERP_CACHE_BACKEND") or "sqlite").strip().lower()
+SERP_CACHE_PATH = os.getenv("SERP_CACHE_PATH") or "serp_cache.sqlite3"
+SERP_CACHE_TTL_S = int(os.getenv("SERP_CACHE_TTL_S") or str(6 * 3600))
+SERP_CACHE_MAX_ENTRIES = int(os.getenv("SERP_CACHE_MAX_ENTRIES") or "5000")
+
+PITCH_CACHE_BACKEND = (os.getenv("PITCH_CACHE_BACKEND") or "sqlite").strip().lower()
+PITCH_CACHE_PATH = os.getenv("PITCH_CACHE_PATH") or "pitch_cache.sqlite3"
+PITCH_CACHE_TTL_S = int(os.getenv("PITCH_CACHE_TTL_S") or str(7 * 24 * 3600))
+PITCH_CACHE_MAX_ENTRIES = int(os.getenv("PITCH_CACHE_MAX_ENTRIES") or "20000")
+
+WEBSITE_PROBE = (os.getenv("WEBSITE_PROBE") or "1").strip().lower() in {"1", "true", "yes", "on"}
+WEBSITE_PROBE_TIMEOUT_S = float(os.getenv("WEBSITE_PROBE_TIMEOUT_S") or "4")
+WEBSITE_PROBE_DEADLINE_S = float(os.getenv("WEBSITE_PROBE_DEADLINE_S") or str(WEBSITE_PROBE_TIMEOUT_S * 2))
+WEBSITE_PROBE_CONCURRENCY = max(1, int(os.getenv("WEBSITE_PROBE_CONCURRENCY") or "20"))
+WEBSITE_PROBE_PER_HOST = max(1, int(os.getenv("WEBSITE_PROBE_PER_HOST") or "2"))
+WEBSITE_PROBE_MAX_BYTES = int(os.getenv("WEBSITE_PROBE_MAX_BYTES") or "65536")
+WEBSITE_PROBE_CACHE_BACKEND = (os.getenv("WEBSITE_PROBE_CACHE_BACKEND") or "sqlite").strip().lower()
+WEBSITE_PROBE_CACHE_PATH = os.getenv("WEBSITE_PROBE_CACHE_PATH") or "website_probe.sqlite3"
+WEBSITE_PROBE_CACHE_TTL_S = int(os.getenv("WEBSITE_PROBE_CACHE_TTL_S") or str(24 * 3600))
+# dead/unreachable results are often transient (timeouts, DNS blips), so they expire much sooner
+WEBSITE_PROBE_NEGATIVE_TTL_S = int(os.getenv("WEBSITE_PROBE_NEGATIVE_TTL_S") or "900")
+WEBSITE_PROBE_CACHE_MAX_ENTRIES = int(os.getenv("WEBSITE_PROBE_CACHE_MAX_ENTRIES") or "20000")
 
 app = FastAPI(title="Lead Gen Sniper", version="2.2.0")
 
@@ -66,6 +149,7 @@ class Lead(BaseModel):
     current_status: str
     detected_url: Optional[str]
     sales_pitch: str
+    website_issues: Optional[List[str]] = None
 
 def _safe_json(obj: Any, limit: int = 2400) -> str:
     try:
@@ -74,29 +158,632 @@ def _safe_json(obj: Any, limit: int = 2400) -> str:
     except Exception:
         return str(obj)
 
-def is_valid_website(url: str) -> bool:
+class _Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            # bucket counts (non-cumulative), then sum, then count
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 3)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            base = _metric_labels(self.label_names, labels)
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                out.append(f"{self.name}_bucket{_metric_labels(self.label_names + ('le',), labels + (repr(float(bound)),))} {cumulative:g}")
+            cumulative += series[len(self.buckets)]
+            out.append(f"{self.name}_bucket{_metric_labels(self.label_names + ('le',), labels + ('+Inf',))} {cumulative:g}")
+            out.append(f"{self.name}_sum{base} {series[-2]:g}")
+            out.append(f"{self.name}_count{base} {series[-1]:g}")
+        return out
+
+class _Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._collect = collect
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        self._series[labels] = self._series.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        series = self._collect() if self._collect is not None else self._series
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in series.items():
+            out.append(f"{self.name}{_metric_labels(self.label_names, labels)} {value:g}")
+        return out
+
+def _escape_label_value(value: Any) -> str:
+    # Prometheus text format: backslash first, so the escapes added for quotes and newlines stay intact
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _metric_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in zip(names, values))
+    return "{" + pairs + "}"
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+METRIC_STAGE_LATENCY = _Histogram(
+    "lead_gen_stage_latency_seconds", "Latency per stage (serp call, gemini batch, lead pipeline).",
+    ("stage", "outcome"), _LATENCY_BUCKETS,
+)
+METRIC_REQUEST_LATENCY = _Histogram(
+    "lead_gen_http_request_seconds", "HTTP request latency per route.", ("path", "status"), _LATENCY_BUCKETS,
+)
+METRIC_GEMINI_BATCH_SIZE = _Histogram(
+    "lead_gen_gemini_batch_size", "Items per Gemini generate call.", (), (1, 2, 3, 5, 8, 13, 20, 40),
+)
+METRIC_LEADS_RETURNED = _Histogram(
+    "lead_gen_leads_returned", "Leads returned per request.", ("endpoint",), (0, 1, 2, 5, 10, 15, 20, 50, 100, 200, 500),
+)
+METRIC_FALLBACKS = _Counter("lead_gen_fallback_pitches_total", "Pitches served from the template fallback.", ("reason",))
+METRIC_429 = _Counter("lead_gen_upstream_429_total", "Rate-limit responses received per upstream.", ("upstream",))
+_METRICS: List[Any] = [METRIC_STAGE_LATENCY, METRIC_REQUEST_LATENCY, METRIC_GEMINI_BATCH_SIZE, METRIC_LEADS_RETURNED, METRIC_FALLBACKS, METRIC_429]
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for m in _METRICS:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+_BUILTIN_PUBLIC_SUFFIXES = {
+    "it", "com", "net", "org", "eu", "info", "biz", "io", "co", "me", "app", "shop", "online", "store", "site",
+    "de", "fr", "es", "ch", "at", "nl", "be", "uk", "co.uk", "org.uk", "us", "au", "com.au", "br", "com.br", "sm", "va",
+}
+
+def _host_of(url: str) -> Optional[str]:
     if not url or not isinstance(url, str):
-        return False
+        return None
+    u = url.strip()
+    if not u:
+        return None
+    if not re.match(r"^https?://", u, re.IGNORECASE):
+        u = "https://" + u
     try:
-        u = url.strip()
-        if not u:
-            return False
-        if not re.match(r"^https?://", u, re.IGNORECASE):
-            u = "https://" + u
-        parsed = urlparse(u)
-        domain = (parsed.netloc or "").lower().strip()
-        if domain.startswith("www."):
-            domain = domain[4:]
-        if not domain or "." not in domain:
-            return False
-        for d in DIRECTORY_DOMAINS:
-            if d in domain:
+        host = (urlparse(u).hostname or "").lower().strip().rstrip(".")
+    except Exception:
+        return None
+    if host.startswith("www."):
+        host = host[4:]
+    if not host or "." not in host:
+        return None
+    return host
+
+def _load_domain_lines(path: str, comment: str = "#") -> List[str]:
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split(comment, 1)[0].strip().lower()
+            if line:
+                out.append(line)
+    return out
+
+class DomainClassifier:
+    """Suffix-trie matcher for directory/aggregator/social domains; entries also block their subdomains."""
+
+    _END = ""
+
+    def __init__(self, builtin: Set[str], list_path: Optional[str], suffix_path: Optional[str], reload_s: float, memo_size: int):
+        self.builtin = set(builtin)
+        self.list_path = list_path
+        self.suffix_path = suffix_path
+        self.reload_s = reload_s
+        self.memo_size = max(1, memo_size)
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtime: Optional[float] = None
+        self._suffixes = self._build_suffixes()
+        self._trie: Dict[str, Any] = {}
+        self._brands: Set[str] = set()
+        self._memo: Dict[str, bool] = {}
+        self.entries = 0
+        self.memo_hits = 0
+        self.lookups = 0
+        self.reload()
+
+    def _build_suffixes(self) -> Dict[str, Any]:
+        rules = set(_BUILTIN_PUBLIC_SUFFIXES)
+        if self.suffix_path:
+            try:
+                # public_suffix_list.dat format; exception ("!") rules are not supported
+                rules.update(r for r in _load_domain_lines(self.suffix_path, comment="//") if not r.startswith("!"))
+            except Exception as e:
+                logger.error(f"DOMAINS public suffix list load failed | path={self.suffix_path} | err={e}")
+        trie: Dict[str, Any] = {}
+        for rule in rules:
+            node = trie
+            for label in reversed(rule.split(".")):
+                node = node.setdefault(label, {})
+            node[self._END] = True
+        return trie
+
+    def _suffix_len(self, labels: List[str]) -> int:
+        node, n, best = self._suffixes, 0, 1
+        for label in reversed(labels):
+            nxt = node.get(label) or node.get("*")
+            if nxt is None:
+                break
+            node, n = nxt, n + 1
+            if nxt.get(self._END):
+                best = n
+        return best
+
+    def reload(self) -> None:
+        entries = set(self.builtin)
+        mtime = None
+        if self.list_path:
+            try:
+                mtime = os.stat(self.list_path).st_mtime
+                entries.update(_load_domain_lines(self.list_path))
+            except FileNotFoundError:
+                logger.warning(f"DOMAINS list not found, using builtin | path={self.list_path}")
+            except Exception as e:
+                logger.error(f"DOMAINS list load failed, keeping previous | path={self.list_path} | err={e}")
+                return
+
+        trie: Dict[str, Any] = {}
+        brands: Set[str] = set()
+        for entry in entries:
+            if "/" in entry:
+                # an entry pasted as a URL blocks its host
+                entry = _host_of(entry) or ""
+                if not entry:
+                    continue
+            entry = entry[2:] if entry.startswith("*.") else entry
+            entry = entry[4:] if entry.startswith("www.") else entry
+            if entry.endswith(".*"):
+                brands.add(entry[:-2])
+                continue
+            labels = entry.split(".")
+            if self._suffix_len(labels) >= len(labels):
+                logger.warning(f"DOMAINS skipping public suffix entry | entry={entry}")
+                continue
+            node = trie
+            for label in reversed(labels):
+                node = node.setdefault(label, {})
+            node[self._END] = True
+
+        with self._lock:
+            self._trie, self._brands, self._memo = trie, brands, {}
+            self._mtime = mtime
+            self.entries = len(entries)
+        logger.info(f"DOMAINS loaded | entries={self.entries} | brands={len(brands)} | path={self.list_path}")
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if not self.list_path or now - self._checked_at < self.reload_s:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.list_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def is_directory_host(self, host: str) -> bool:
+        self.lookups += 1
+        hit = self._memo.get(host)
+        if hit is not None:
+            self.memo_hits += 1
+            return hit
+
+        labels = host.split(".")
+        node, blocked = self._trie, False
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                break
+            if node.get(self._END):
+                blocked = True
+                break
+        if not blocked and self._brands:
+            k = self._suffix_len(labels)
+            if len(labels) > k and labels[-(k + 1)] in self._brands:
+                blocked = True
+
+        if len(self._memo) >= self.memo_size:
+            self._memo = {}
+        self._memo[host] = blocked
+        return blocked
+
+    def registrable_domain(self, host: str) -> str:
+        labels = host.split(".")
+        return ".".join(labels[-(self._suffix_len(labels) + 1):])
+
+    def classify(self, urls: List[Optional[str]]) -> List[str]:
+        self._maybe_reload()
+        out = []
+        for url in urls:
+            if not url:
+                out.append("No Website")
+                continue
+            host = _host_of(url)
+            if host is None or self.is_directory_host(host):
+                out.append("Directory Only")
+            else:
+                out.append("Has Website")
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": self.entries,
+            "brands": len(self._brands),
+            "list_path": self.list_path,
+            "memo_size": len(self._memo),
+            "lookups": self.lookups,
+            "memo_hits": self.memo_hits,
+        }
+
+DOMAIN_CLASSIFIER = DomainClassifier(
+    DIRECTORY_DOMAINS, DIRECTORY_DOMAINS_FILE, PUBLIC_SUFFIX_FILE, DOMAIN_LIST_RELOAD_S, DOMAIN_MEMO_SIZE,
+)
+
+class ResponseCache(ABC):
+    """Key/value cache with a per-entry TTL and LRU eviction; async callers use aget/aset."""
+
+    def __init__(self, name: str, ttl_s: int, max_entries: int):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl_s: Optional[int] = None) -> None: ...
+
+    @abstractmethod
+    def size(self) -> int: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [self.get(k) for k in keys]
+
+    def set_many(self, values: Dict[str, Any], ttl_s: Optional[int] = None) -> None:
+        for k, v in values.items():
+            self.set(k, v, ttl_s)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl_s: Optional[int] = None) -> None:
+        self.set(key, value, ttl_s)
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return self.get_many(keys)
+
+    async def aset_many(self, values: Dict[str, Any], ttl_s: Optional[int] = None) -> None:
+        self.set_many(values, ttl_s)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "entries": self.size(),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+        }
+
+class NullResponseCache(ResponseCache):
+    def get(self, key: str) -> Optional[Any]:
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl_s: Optional[int] = None) -> None:
+        return None
+
+    def size(self) -> int:
+        return 0
+
+    def clear(self) -> None:
+        return None
+
+class MemoryResponseCache(ResponseCache):
+    def __init__(self, name: str, ttl_s: int, max_entries: int):
+        super().__init__(name, ttl_s, max_entries)
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl_s: Optional[int] = None) -> None:
+        self._data[key] = (time.time() + (ttl_s or self.ttl_s), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+        self.writes += 1
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+class SQLiteResponseCache(ResponseCache):
+    """Disk-backed LRU cache with one zlib-compressed JSON row per key."""
+
+    RECOUNT_EVERY = 1000
+
+    def __init__(self, name: str, ttl_s: int, max_entries: int, path: str):
+        super().__init__(name, ttl_s, max_entries)
+        self.path = path
+        self._table = re.sub(r"[^a-z0-9_]", "_", name.lower())
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._table}_accessed ON {self._table}(accessed_at)")
+            self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._count -= self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,)).rowcount
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self._table} SET accessed_at = ? WHERE key = ?", (now, key))
+        try:
+            value = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        except Exception as e:
+            logger.warning(f"CACHE corrupt entry | cache={self.name} | key={key} | err={e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[int] = None) -> None:
+        now = time.time()
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        with self._lock, self._conn:
+            exists = self._conn.execute(f"SELECT 1 FROM {self._table} WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, blob, now + (ttl_s or self.ttl_s), now),
+            )
+            self._count += 0 if exists else 1
+            self.writes += 1
+            if self.writes % self.RECOUNT_EVERY == 0:
+                self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+            if self._count > self.max_entries:
+                self._count -= self._conn.execute(f"DELETE FROM {self._table} WHERE expires_at < ?", (now,)).rowcount
+            if self._count > self.max_entries:
+                self._count -= self._conn.execute(
+                    f"DELETE FROM {self._table} WHERE key IN "
+                    f"(SELECT key FROM {self._table} ORDER BY accessed_at ASC LIMIT ?)",
+                    (self._count - self.max_entries,),
+                ).rowcount
+
+    def size(self) -> int:
+        with self._lock:
+            self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+            return self._count
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self._table}")
+            self._count = 0
+
+    async def aget(self, key: str) -> Optional[Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl_s: Optional[int] = None) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.set, key, value, ttl_s)
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[Any]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_many, keys)
+
+    async def aset_many(self, values: Dict[str, Any], ttl_s: Optional[int] = None) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.set_many, values, ttl_s)
+
+def make_cache(name: str, backend: str, ttl_s: int, max_entries: int, path: str) -> ResponseCache:
+    if backend in {"off", "none", "disabled", "0"}:
+        return NullResponseCache(name, ttl_s, max_entries)
+    if backend == "memory":
+        return MemoryResponseCache(name, ttl_s, max_entries)
+    try:
+        return SQLiteResponseCache(name, ttl_s, max_entries, path)
+    except Exception as e:
+        logger.exception(f"CACHE sqlite init failed, using memory | cache={name} | path={path} | err={e}")
+        return MemoryResponseCache(name, ttl_s, max_entries)
+
+SERP_CACHE = make_cache("serp_responses", SERP_CACHE_BACKEND, SERP_CACHE_TTL_S, SERP_CACHE_MAX_ENTRIES, SERP_CACHE_PATH)
+
+def _serp_cache_key(params: Dict[str, Any]) -> str:
+    material = {k: v for k, v in params.items() if k != "api_key"}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class UpstreamLimiter:
+    """Token bucket plus circuit breaker for one upstream API."""
+
+    def __init__(self, name: str, rate_per_min: float, burst: int, min_rate_per_min: float = 1.0, probe_timeout_s: float = 60.0):
+        self.name = name
+        self.base_rate = max(0.01, rate_per_min) / 60.0
+        self.min_rate = min(self.base_rate, max(0.01, min_rate_per_min) / 60.0)
+        self.rate = self.base_rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.state = "closed"
+        self.open_until = 0.0
+        self.probe_inflight = False
+        self.probe_started = 0.0
+        self.probe_timeout_s = probe_timeout_s
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.last_retry_s: Optional[int] = None
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait_s: float = 0.0) -> bool:
+        deadline = time.monotonic() + max(0.0, max_wait_s)
+        while True:
+            now = time.monotonic()
+            if self.state == "open" and now >= self.open_until:
+                self.state = "half_open"
+                self.probe_inflight = False
+            if self.state == "open":
+                wait = self.open_until - now
+            elif self.state == "half_open":
+                if self.probe_inflight and now - self.probe_started > self.probe_timeout_s:
+                    logger.warning(f"LIMITER stale probe released | upstream={self.name}")
+                    self.probe_inflight = False
+                if not self.probe_inflight:
+                    self.probe_inflight = True
+                    self.probe_started = now
+                    self.granted += 1
+                    return True
+                wait = 0.25
+            else:
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.granted += 1
+                    return True
+                wait = (1.0 - self.tokens) / self.rate
+            if now + wait > deadline:
+                self.rejected += 1
                 return False
-        return True
+            await asyncio.sleep(wait)
+
+    def record_success(self) -> None:
+        if self.state == "half_open":
+            logger.info(f"LIMITER close | upstream={self.name}")
+            self.state = "closed"
+            self.probe_inflight = False
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+        self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+    def record_failure(self) -> None:
+        if self.state == "half_open":
+            self.probe_inflight = False
+
+    def record_abandoned(self) -> None:
+        """The granted call was cancelled before it had an outcome; lets the next probe through."""
+        if self.state == "half_open":
+            self.probe_inflight = False
+
+    def record_429(self, retry_s: int) -> None:
+        now = time.monotonic()
+        self.throttled += 1
+        self.last_retry_s = retry_s
+        self.rate = max(self.min_rate, self.rate * 0.5)
+        self.tokens = 0.0
+        self.updated = now
+        self.open_until = max(self.open_until, now + max(1, retry_s))
+        self.probe_inflight = False
+        if self.state != "open":
+            logger.warning(f"LIMITER open | upstream={self.name} | retry_s={retry_s} | rate_per_min={self.rate * 60:.2f}")
+        self.state = "open"
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self.state == "closed":
+            self._refill(now)
+        return {
+            "state": self.state,
+            "open_for_s": round(max(0.0, self.open_until - now), 1) if self.state == "open" else 0,
+            "rate_per_min": round(self.rate * 60, 2),
+            "base_rate_per_min": round(self.base_rate * 60, 2),
+            "tokens": round(self.tokens, 2),
+            "burst": self.burst,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "last_retry_s": self.last_retry_s,
+        }
+
+GEMINI_LIMITER = UpstreamLimiter("gemini", GEMINI_RATE_PER_MIN, GEMINI_BURST)
+SERPAPI_LIMITER = UpstreamLimiter("serpapi", SERPAPI_RATE_PER_MIN, SERPAPI_BURST)
+
+def _limiter_snapshot() -> Dict[str, Any]:
+    return {"gemini": GEMINI_LIMITER.snapshot(), "serpapi": SERPAPI_LIMITER.snapshot()}
+
+def _retry_after_seconds(resp: httpx.Response) -> int:
+    try:
+        return max(1, int(float(resp.headers.get("retry-after") or "10")))
     except Exception:
+        return 10
+
+_SERP_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
         return False
 
-async def search_google_maps(query: str, start: int, hl: str = "it") -> Dict[str, Any]:
+def get_serp_client() -> httpx.AsyncClient:
+    global _SERP_CLIENT
+    if _SERP_CLIENT is None or _SERP_CLIENT.is_closed:
+        _SERP_CLIENT = httpx.AsyncClient(
+            base_url=SERPAPI_BASE_URL,
+            http2=_http2_available(),
+            timeout=httpx.Timeout(SERPAPI_TIMEOUT_S, connect=min(10.0, SERPAPI_TIMEOUT_S)),
+            limits=httpx.Limits(
+                max_connections=SERPAPI_MAX_CONNECTIONS,
+                max_keepalive_connections=SERPAPI_MAX_CONNECTIONS,
+                keepalive_expiry=60,
+            ),
+        )
+    return _SERP_CLIENT
+
+async def close_serp_client() -> None:
+    global _SERP_CLIENT
+    if _SERP_CLIENT is not None and not _SERP_CLIENT.is_closed:
+        await _SERP_CLIENT.aclose()
+    _SERP_CLIENT = None
+
+async def search_google_maps(query: str, start: int, hl: str = "it", refresh: bool = False) -> Dict[str, Any]:
     params = {
         "engine": "google_maps",
         "type": "search",
@@ -105,17 +792,158 @@ async def search_google_maps(query: str, start: int, hl: str = "it") -> Dict[str
         "api_key": SERPAPI_API_KEY,
         "start": start,
     }
-    loop = asyncio.get_running_loop()
+    cache_key = _serp_cache_key(params)
+    if not refresh:
+        try:
+            cached = await SERP_CACHE.aget(cache_key)
+        except Exception as e:
+            logger.warning(f"SERPAPI cache read failed | q={query} | start={start} | err={e}")
+            cached = None
+        if isinstance(cached, dict):
+            return cached
+
+    if not await SERPAPI_LIMITER.acquire(SERPAPI_LIMITER_MAX_WAIT_S):
+        logger.warning(f"SERPAPI limiter rejected | q={query} | start={start} | state={SERPAPI_LIMITER.state}")
+        return {}
+
+    client = get_serp_client()
     t0 = time.time()
     try:
-        data = await loop.run_in_executor(None, lambda: GoogleSearch(params).get_dict())
+        resp = await client.get("/search.json", params={**params, "output": "json"})
+    except asyncio.CancelledError:
+        SERPAPI_LIMITER.record_abandoned()
+        raise
     except Exception as e:
-        logger.exception(f"SERPAPI request failed | params={_safe_json(params)} | err={e}")
+        SERPAPI_LIMITER.record_failure()
+        METRIC_STAGE_LATENCY.observe(time.time() - t0, "serp", "error")
+        logger.exception(f"SERPAPI request failed | params={_safe_json({**params, 'api_key': '***'})} | err={e}")
         return {}
     dt = int((time.time() - t0) * 1000)
+    METRIC_STAGE_LATENCY.observe(dt / 1000.0, "serp", "ok" if resp.status_code < 400 else str(resp.status_code))
+    if resp.status_code == 429:
+        retry_s = _retry_after_seconds(resp)
+        SERPAPI_LIMITER.record_429(retry_s)
+        METRIC_429.inc("serpapi")
+        logger.error(f"SERPAPI 429 | start={start} | ms={dt} | retry_s={retry_s}")
+        return {}
+    if resp.status_code >= 500:
+        SERPAPI_LIMITER.record_failure()
+    else:
+        SERPAPI_LIMITER.record_success()
+    try:
+        data = resp.json()
+    except Exception:
+        logger.error(f"SERPAPI non-json response | start={start} | status={resp.status_code} | ms={dt} | body={resp.text[:300]}")
+        return {}
     if isinstance(data, dict) and data.get("error"):
         logger.error(f"SERPAPI error field | start={start} | error={data.get('error')}")
-    return data if isinstance(data, dict) else {}
+        return data
+    if not isinstance(data, dict):
+        return {}
+    try:
+        await SERP_CACHE.aset(cache_key, data)
+    except Exception as e:
+        logger.warning(f"SERPAPI cache write failed | q={query} | start={start} | err={e}")
+    return data
+
+class SerpFetchPlanner:
+    """Fetches query pages concurrently, as far as remaining() needs them, and yields them in plan order."""
+
+    def __init__(
+        self,
+        fetch: Callable[[str, int], Awaitable[Dict[str, Any]]],
+        queries: List[Tuple[str, str]],
+        remaining: Callable[[], int] = lambda: 1 << 30,
+        max_inflight: int = SERP_MAX_INFLIGHT,
+        max_start: int = SERP_MAX_START,
+    ):
+        self._fetch = fetch
+        self._queries = queries
+        self._remaining = remaining
+        self._max_start = max_start
+        self._sem = asyncio.Semaphore(max(1, max_inflight))
+        self._fetches: List[Deque[Tuple[int, asyncio.Task]]] = [deque() for _ in queries]
+        self._next_start = [0] * len(queries)
+        self._pending = 0
+        self._consumed = 0
+        self._initial = 0
+
+    async def _fetch_page(self, q: str, start: int) -> Dict[str, Any]:
+        async with self._sem:
+            return await self._fetch(q, start)
+
+    def _can_launch(self, idx: int) -> bool:
+        return self._next_start[idx] < self._max_start
+
+    def _launch(self, idx: int) -> None:
+        start = self._next_start[idx]
+        self._next_start[idx] = start + SERP_PAGE_SIZE
+        self._pending += 1
+        self._fetches[idx].append((start, asyncio.create_task(self._fetch_page(self._queries[idx][1], start))))
+
+    def _drop(self, idx: int) -> None:
+        # the query has no more results: pages fetched past its end are not needed
+        self._next_start[idx] = self._max_start
+        while self._fetches[idx]:
+            _, task = self._fetches[idx].popleft()
+            task.cancel()
+            self._pending -= 1
+
+    def _start_more(self) -> None:
+        remaining = self._remaining()
+        if remaining <= 0:
+            return
+        # leads per consumed page so far; a full page is assumed until the first one is consumed
+        found = self._initial - remaining
+        per_page = found / self._consumed if self._consumed else SERP_PAGE_SIZE
+        for idx in range(len(self._queries)):
+            while self._pending * per_page < remaining and self._can_launch(idx):
+                self._launch(idx)
+            if self._pending * per_page >= remaining:
+                return
+
+    async def pages(self) -> AsyncIterator[Tuple[str, int, Dict[str, Any]]]:
+        self._initial = self._remaining()
+        if self._queries:
+            self._launch(0)
+        self._start_more()
+        try:
+            for idx, (key, q) in enumerate(self._queries):
+                while True:
+                    fetches = self._fetches[idx]
+                    if not fetches:
+                        if self._remaining() <= 0 or not self._can_launch(idx):
+                            break
+                        self._launch(idx)
+                    start, task = fetches.popleft()
+                    try:
+                        data = await task
+                    except asyncio.CancelledError:
+                        self._pending -= 1
+                        raise
+                    except Exception as e:
+                        self._pending -= 1
+                        logger.error(f"SERP planner fetch failed | q={q} | start={start} | err={e}")
+                        self._drop(idx)
+                        self._start_more()
+                        break
+                    self._pending -= 1
+                    if len(data.get("local_results") or []) < SERP_PAGE_SIZE:
+                        self._drop(idx)
+                    yield key, start, data
+                    self._consumed += 1
+                    self._start_more()
+                if self._remaining() <= 0:
+                    break
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        pending = [task for fetches in self._fetches for _, task in fetches]
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
 
 def _short_model_name(n: str) -> str:
     n = (n or "").strip()
@@ -142,19 +970,107 @@ def _extract_retry_seconds(e: Exception) -> int:
             return 10
     return 10
 
-_MODEL_OBJ: Optional[genai.GenerativeModel] = None
+def _is_model_not_found(e: Exception) -> bool:
+    s = str(e).lower()
+    return "model" in s and ("404" in s or "not found" in s or "notfound" in s)
+
+_GENAI: Any = None
+_GENAI_LOCK = threading.Lock()
+
+def _genai() -> Any:
+    """google.generativeai is imported on first use; it is the slowest import of a cold start."""
+    global _GENAI
+    if _GENAI is None:
+        with _GENAI_LOCK:
+            if _GENAI is None:
+                t0 = time.perf_counter()
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _GENAI = genai
+                logger.info(f"GEMINI sdk imported | ms={int((time.perf_counter() - t0) * 1000)}")
+    return _GENAI
+
+_MODEL_OBJ: Any = None
 _MODEL_NAME: Optional[str] = None
+_MODEL_SOURCE: Optional[str] = None
+_MODEL_OUTPUT_LIMIT: Optional[int] = None
+_MODEL_CHOICE_READ = False
 _MODEL_LOCK = asyncio.Lock()
 
-async def _list_models_generatecontent() -> List[str]:
+def _load_model_choice() -> Optional[Tuple[str, Optional[int]]]:
+    try:
+        with open(GEMINI_MODEL_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"GEMINI model cache unreadable | path={GEMINI_MODEL_CACHE_PATH} | err={e}")
+        return None
+    if not isinstance(data, dict):
+        logger.warning(f"GEMINI model cache unreadable | path={GEMINI_MODEL_CACHE_PATH} | err=expected an object, got {type(data).__name__}")
+        return None
+    try:
+        age = time.time() - float(data.get("validated_at") or 0)
+    except (TypeError, ValueError):
+        logger.warning(f"GEMINI model cache unreadable | path={GEMINI_MODEL_CACHE_PATH} | err=bad validated_at")
+        return None
+    if data.get("requested") != (GEMINI_MODEL or None) or age > GEMINI_MODEL_CACHE_TTL_S:
+        logger.info(f"GEMINI model cache stale | model={data.get('model')} | age_s={int(age)} | requested={data.get('requested')}")
+        return None
+    if not isinstance(data.get("model"), str) or not data["model"]:
+        return None
+    limit = data.get("output_token_limit")
+    return data["model"], limit if isinstance(limit, int) and limit > 0 else None
+
+def _current_model_name() -> Optional[str]:
+    # the persisted choice is read from disk at most once; after that only init_model sets the name
+    global _MODEL_NAME, _MODEL_SOURCE, _MODEL_OUTPUT_LIMIT, _MODEL_CHOICE_READ
+    if _MODEL_NAME is None and not _MODEL_CHOICE_READ:
+        _MODEL_CHOICE_READ = True
+        cached = _load_model_choice()
+        if cached:
+            (_MODEL_NAME, _MODEL_OUTPUT_LIMIT), _MODEL_SOURCE = cached, "cache"
+    return _MODEL_NAME
+
+def _max_output_tokens() -> int:
+    limit = _MODEL_OUTPUT_LIMIT or GEMINI_DEFAULT_OUTPUT_TOKENS
+    return min(GEMINI_MAX_OUTPUT_TOKENS, limit) if GEMINI_MAX_OUTPUT_TOKENS > 0 else limit
+
+def _save_model_choice(model: str, output_token_limit: Optional[int]) -> None:
+    tmp = GEMINI_MODEL_CACHE_PATH + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": model, "output_token_limit": output_token_limit,
+                "validated_at": time.time(), "requested": GEMINI_MODEL or None,
+            }, f)
+        os.replace(tmp, GEMINI_MODEL_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"GEMINI model cache write failed | path={GEMINI_MODEL_CACHE_PATH} | err={e}")
+
+def _invalidate_model_choice(reason: str) -> None:
+    global _MODEL_OBJ, _MODEL_NAME, _MODEL_SOURCE, _MODEL_OUTPUT_LIMIT
+    logger.error(f"GEMINI model invalidated, will re-list | model={_MODEL_NAME} | source={_MODEL_SOURCE} | reason={reason[:200]}")
+    _MODEL_OBJ = None
+    _MODEL_NAME = None
+    _MODEL_SOURCE = None
+    _MODEL_OUTPUT_LIMIT = None
+    try:
+        os.remove(GEMINI_MODEL_CACHE_PATH)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"GEMINI model cache remove failed | path={GEMINI_MODEL_CACHE_PATH} | err={e}")
+
+async def _list_models_generatecontent() -> Dict[str, Optional[int]]:
     loop = asyncio.get_running_loop()
-    models = await loop.run_in_executor(None, lambda: list(genai.list_models()))
-    out = []
+    models = await loop.run_in_executor(None, lambda: list(_genai().list_models()))
+    out: Dict[str, Optional[int]] = {}
     for m in models:
         name = getattr(m, "name", None)
         methods = getattr(m, "supported_generation_methods", None) or []
         if name and "generateContent" in methods:
-            out.append(name)
+            out[name] = getattr(m, "output_token_limit", None)
     return out
 
 def _pick_model(available_full: List[str]) -> Optional[str]:
@@ -172,28 +1088,40 @@ def _pick_model(available_full: List[str]) -> Optional[str]:
             return n
     return available_short[0] if available_short else None
 
-async def init_model() -> None:
-    global _MODEL_OBJ, _MODEL_NAME
-    try:
-        available = await _list_models_generatecontent()
-    except Exception as e:
-        logger.exception(f"GEMINI list_models failed | err={e}")
-        _MODEL_OBJ = None
-        _MODEL_NAME = None
-        return
-
-    chosen = _pick_model(available)
+async def init_model(validate: bool = False) -> None:
+    """Picks the model (startup choice, persisted choice, or list_models) and builds it."""
+    global _MODEL_OBJ, _MODEL_NAME, _MODEL_SOURCE, _MODEL_OUTPUT_LIMIT
+    chosen, source = (None, None) if validate else (_MODEL_NAME, _MODEL_SOURCE)
+    output_limit = None if validate else _MODEL_OUTPUT_LIMIT
+    if not chosen and not validate:
+        cached = _load_model_choice()
+        if cached:
+            (chosen, output_limit), source = cached, "cache"
     if not chosen:
-        logger.error(f"GEMINI: no suitable model. env_requested={GEMINI_MODEL or None}")
-        _MODEL_OBJ = None
-        _MODEL_NAME = None
-        return
+        try:
+            available = await _list_models_generatecontent()
+        except Exception as e:
+            logger.exception(f"GEMINI list_models failed | err={e}")
+            _MODEL_OBJ = None
+            _MODEL_NAME = None
+            return
 
-    _MODEL_NAME = chosen
-    _MODEL_OBJ = genai.GenerativeModel(model_name=chosen, generation_config=generation_config)
-    logger.info(f"GEMINI model selected | model={_MODEL_NAME}")
+        chosen, source = _pick_model(list(available)), "list_models"
+        if not chosen:
+            logger.error(f"GEMINI: no suitable model. env_requested={GEMINI_MODEL or None}")
+            _MODEL_OBJ = None
+            _MODEL_NAME = None
+            return
+        output_limit = {_short_model_name(k): v for k, v in available.items()}.get(chosen)
+        _save_model_choice(chosen, output_limit)
 
-async def get_model() -> genai.GenerativeModel:
+    genai = await asyncio.get_running_loop().run_in_executor(None, _genai)
+    _MODEL_NAME, _MODEL_SOURCE, _MODEL_OUTPUT_LIMIT = chosen, source, output_limit
+    config = {**generation_config, "max_output_tokens": _max_output_tokens()}
+    _MODEL_OBJ = genai.GenerativeModel(model_name=chosen, generation_config=config)
+    logger.info(f"GEMINI model selected | model={_MODEL_NAME} | source={source} | max_output_tokens={config['max_output_tokens']}")
+
+async def get_model() -> Any:
     global _MODEL_OBJ
     if _MODEL_OBJ is not None:
         return _MODEL_OBJ
@@ -210,6 +1138,14 @@ def _fallback_pitch(name: str, city: str, category: str, status: str, url: Optio
         pain = "se un cliente ti cerca su Google oggi, può trovare solo i concorrenti o informazioni incomplete."
         ag = "senza un sito tuo perdi prenotazioni e credibilità, e non controlli i contatti."
         sol = "posso crearti un sito veloce con prenotazioni/contatti e SEO locale per Milano."
+    elif status == "Dead Website":
+        pain = f"il sito indicato su Google ({url or 'il tuo sito'}) oggi non risponde."
+        ag = "chi clicca trova una pagina di errore e passa al concorrente successivo, e Google lo nota."
+        sol = "posso rimettere online un sito veloce e monitorato, con prenotazioni/contatti e SEO locale."
+    elif status == "Outdated Website":
+        pain = f"il tuo sito ({url or 'attuale'}) non è sicuro (HTTPS) o non è pensato per lo smartphone."
+        ag = "i browser lo segnalano come non sicuro e da mobile, dove arriva la maggior parte delle ricerche, è scomodo da usare."
+        sol = "posso rifarlo moderno, sicuro e mobile-first, mantenendo dominio e contenuti."
     else:
         pain = f"oggi la tua presenza sembra appoggiata a piattaforme terze ({url or 'directory'})."
         ag = "questo significa dipendere da algoritmi e recensioni, con poca proprietà del brand e dei dati."
@@ -236,85 +1172,375 @@ def _parse_json_array(text: str) -> Optional[List[Dict[str, Any]]]:
         except Exception:
             return None
 
-async def generate_sales_copy_batch(items: List[Dict[str, Any]], city: str, category: str, rid: str) -> List[str]:
-    model = await get_model()
+PITCH_PROMPT_TEMPLATE = (
+    "Sei un esperto Senior di Digital Marketing e Sales Psychology.\n"
+    "Genera email di cold outreach in italiano per ciascun elemento.\n"
+    "Regole: max 150 parole, PAS (Problem, Agitation, Solution), CTA finale: \"Possiamo parlarne per 5 minuti?\".\n"
+    "Non includere oggetto. Includi firma:\n"
+    "Artur Onoicencu | Web Developer & Growth Partner\n"
+    "Tel: 3276577730\n\n"
+    "Ogni elemento indica la propria città e categoria: usale per personalizzare quella email.\n"
+    "Se presente, website_issues elenca i problemi rilevati sul sito attuale "
+    "(dead = non raggiungibile, redirects_to_directory = rimanda a una directory/social, "
+    "no_https = senza HTTPS, no_mobile_viewport = non ottimizzato per mobile): usali come Problem.\n\n"
+    "Input JSON:\n"
+    "{payload}\n\n"
+    "Output: restituisci SOLO un JSON array, stesso ordine e stessa lunghezza, con oggetti:\n"
+    "{{\"i\": <int>, \"sales_pitch\": <string>}}\n"
+    "Nessun testo extra."
+)
+PITCH_PROMPT_HASH = hashlib.sha256(PITCH_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:16]
+
+PITCH_CACHE = make_cache("sales_pitches", PITCH_CACHE_BACKEND, PITCH_CACHE_TTL_S, PITCH_CACHE_MAX_ENTRIES, PITCH_CACHE_PATH)
+
+def _pitch_cache_key(it: Dict[str, Any], city: str, category: str, model_name: Optional[str]) -> str:
+    dedupe_key = it.get("dedupe_key") or _lead_dedupe_key(it["business_name"], it.get("address"), it.get("phone"))
+    material = [
+        list(dedupe_key),
+        (city or "").strip().lower(),
+        (category or "").strip().lower(),
+        it["current_status"],
+        model_name,
+        PITCH_PROMPT_HASH,
+    ]
+    if it.get("website_issues"):
+        material.append(sorted(it["website_issues"]))
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class JsonArrayStreamParser:
+    """Incremental parser that returns each top-level object of a streamed JSON array as it closes."""
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._buf: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for ch in text:
+            if self.finished:
+                break
+            if not self.started:
+                self.started = ch == "["
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                elif ch == "]":
+                    self.finished = True
+                continue
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads("".join(self._buf))
+                        if isinstance(obj, dict):
+                            out.append(obj)
+                    except Exception:
+                        pass
+                    self._buf = []
+        return out
+
+PITCH_CHUNK_STATS = {"batches": 0, "chunks": 0, "items": 0, "parse_failures": 0, "retried_items": 0, "missing_items": 0, "limiter_rejected_items": 0}
+
+class GeminiLimiterRejected(RuntimeError):
+    pass
 
+def _apply_pitch_obj(pitches: List[Optional[str]], obj: Dict[str, Any]) -> None:
+    try:
+        i = int(obj.get("i"))
+        sp = str(obj.get("sales_pitch") or "").strip()
+    except Exception:
+        return
+    if 0 <= i < len(pitches) and sp and pitches[i] is None:
+        pitches[i] = sp
+
+async def _generate_pitches_uncached(model: Any, items: List[Dict[str, Any]], rid: str) -> List[Optional[str]]:
     payload = []
     for idx, it in enumerate(items):
         payload.append({
             "i": idx,
+            "city": it.get("city"),
+            "category": it.get("category"),
             "business_name": it["business_name"],
             "current_status": it["current_status"],
             "detected_url": it.get("detected_url"),
         })
+        if it.get("website_issues"):
+            payload[-1]["website_issues"] = it["website_issues"]
 
-    prompt = (
-        "Sei un esperto Senior di Digital Marketing e Sales Psychology.\n"
-        "Genera email di cold outreach in italiano per ciascun elemento.\n"
-        "Regole: max 150 parole, PAS (Problem, Agitation, Solution), CTA finale: \"Possiamo parlarne per 5 minuti?\".\n"
-        "Non includere oggetto. Includi firma:\n"
-        "Artur Onoicencu | Web Developer & Growth Partner\n"
-        "Tel: 3276577730\n\n"
-        f"Città: {city}\n"
-        f"Categoria: {category}\n\n"
-        "Input JSON:\n"
-        f"{json.dumps(payload, ensure_ascii=False)}\n\n"
-        "Output: restituisci SOLO un JSON array, stesso ordine e stessa lunghezza, con oggetti:\n"
-        "{\"i\": <int>, \"sales_pitch\": <string>}\n"
-        "Nessun testo extra."
-    )
+    prompt = PITCH_PROMPT_TEMPLATE.format(payload=json.dumps(payload, ensure_ascii=False))
+
+    if not await GEMINI_LIMITER.acquire(GEMINI_LIMITER_MAX_WAIT_S):
+        logger.warning(f"GEMINI limiter rejected, using fallback | rid={rid} | items={len(items)} | state={GEMINI_LIMITER.state}")
+        raise GeminiLimiterRejected(f"gemini limiter {GEMINI_LIMITER.state}")
 
+    pitches: List[Optional[str]] = [None] * len(items)
+    text = ""
+    METRIC_GEMINI_BATCH_SIZE.observe(len(items))
     t0 = time.time()
     try:
-        resp = await model.generate_content_async(prompt)
-        text = (resp.text or "").strip()
+        if GEMINI_STREAM:
+            # objects are parsed as soon as they close, so a broken stream keeps what already arrived
+            parser = JsonArrayStreamParser()
+            resp = await model.generate_content_async(prompt, stream=True)
+            async for chunk in resp:
+                try:
+                    part = chunk.text or ""
+                except Exception:
+                    continue
+                text += part
+                for obj in parser.feed(part):
+                    _apply_pitch_obj(pitches, obj)
+        else:
+            resp = await model.generate_content_async(prompt)
+            text = resp.text or ""
         dt = int((time.time() - t0) * 1000)
+        GEMINI_LIMITER.record_success()
 
-        arr = _parse_json_array(text)
-        if not isinstance(arr, list):
-            logger.error(f"GEMINI batch parse failed | rid={rid} | raw={text[:500]}")
-            return [
-                _fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url"))
-                for it in items
-            ]
-
-        pitches = [""] * len(items)
-        for obj in arr:
-            try:
-                i = int(obj.get("i"))
-                sp = str(obj.get("sales_pitch") or "").strip()
-                if 0 <= i < len(pitches) and sp:
-                    pitches[i] = sp
-            except Exception:
-                continue
-
-        for i, it in enumerate(items):
-            if not pitches[i]:
-                pitches[i] = _fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url"))
+        if not any(pitches):
+            arr = _parse_json_array(text.strip())
+            if not isinstance(arr, list):
+                PITCH_CHUNK_STATS["parse_failures"] += 1
+                METRIC_STAGE_LATENCY.observe(dt / 1000.0, "gemini", "parse_error")
+                logger.error(f"GEMINI batch parse failed | rid={rid} | items={len(items)} | ms={dt} | raw={text[:500]}")
+                return pitches
+            for obj in arr:
+                if isinstance(obj, dict):
+                    _apply_pitch_obj(pitches, obj)
 
+        METRIC_STAGE_LATENCY.observe(dt / 1000.0, "gemini", "ok" if all(pitches) else "partial")
         return pitches
 
+    except asyncio.CancelledError:
+        GEMINI_LIMITER.record_abandoned()
+        raise
     except Exception as e:
         dt = int((time.time() - t0) * 1000)
+        received = sum(1 for p in pitches if p)
         if _is_429(e):
             retry_s = _extract_retry_seconds(e)
-            logger.error(f"GEMINI batch 429 | rid={rid} | ms={dt} | model={_MODEL_NAME} | retry_s={retry_s} | err={e}")
-            return [
-                _fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url"))
-                for it in items
-            ]
-        logger.exception(f"GEMINI batch fail | rid={rid} | ms={dt} | model={_MODEL_NAME} | err={e}")
-        return [
-            _fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url"))
-            for it in items
-        ]
+            GEMINI_LIMITER.record_429(retry_s)
+            METRIC_429.inc("gemini")
+            METRIC_STAGE_LATENCY.observe(dt / 1000.0, "gemini", "429")
+            logger.error(f"GEMINI batch 429 | rid={rid} | ms={dt} | model={_MODEL_NAME} | retry_s={retry_s} | received={received} | err={e}")
+            return pitches
+        if _is_model_not_found(e) and model is _MODEL_OBJ:
+            _invalidate_model_choice(str(e))
+        GEMINI_LIMITER.record_failure()
+        METRIC_STAGE_LATENCY.observe(dt / 1000.0, "gemini", "error")
+        logger.exception(f"GEMINI batch fail | rid={rid} | ms={dt} | model={_MODEL_NAME} | received={received}/{len(items)} | err={e}")
+        return pitches
+
+def _estimate_pitch_tokens(it: Dict[str, Any]) -> int:
+    # ~150 Italian words plus the JSON wrapper; the business name is repeated in the greeting
+    return PITCH_TOKENS_PER_ITEM + len(it.get("business_name") or "") // 3
+
+def _plan_pitch_chunks(items: List[Dict[str, Any]]) -> List[List[int]]:
+    budget = int(_max_output_tokens() * PITCH_TOKEN_BUDGET_RATIO)
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i, it in enumerate(items):
+        cost = _estimate_pitch_tokens(it)
+        if current and used + cost > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def _generate_pitches_chunked(model: Any, items: List[Dict[str, Any]], rid: str) -> List[Optional[str]]:
+    pitches: List[Optional[str]] = [None] * len(items)
+    rejected: Set[int] = set()
+    sem = asyncio.Semaphore(PITCH_CHUNK_CONCURRENCY)
+
+    async def _run_chunk(idxs: List[int]) -> None:
+        async with sem:
+            try:
+                out = await _generate_pitches_uncached(model, [items[i] for i in idxs], rid=rid)
+            except GeminiLimiterRejected:
+                rejected.update(idxs)
+                return
+        for i, p in zip(idxs, out):
+            pitches[i] = p
+
+    chunks = _plan_pitch_chunks(items)
+    await asyncio.gather(*[_run_chunk(c) for c in chunks])
+
+    # items the limiter turned away already waited their bounded share; retrying them now would hit the same empty bucket
+    retried = [i for i, p in enumerate(pitches) if p is None and i not in rejected]
+    retry_chunks: List[List[int]] = []
+    if retried and GEMINI_LIMITER.state == "closed":
+        retry_chunks = [[retried[j] for j in c] for c in _plan_pitch_chunks([items[i] for i in retried])]
+        await asyncio.gather(*[_run_chunk(c) for c in retry_chunks])
+    else:
+        retried = []
+
+    missing = sum(1 for p in pitches if p is None)
+    PITCH_CHUNK_STATS["batches"] += 1
+    PITCH_CHUNK_STATS["chunks"] += len(chunks) + len(retry_chunks)
+    PITCH_CHUNK_STATS["items"] += len(items)
+    PITCH_CHUNK_STATS["retried_items"] += len(retried)
+    PITCH_CHUNK_STATS["missing_items"] += missing
+    PITCH_CHUNK_STATS["limiter_rejected_items"] += len(rejected)
+    parse_rate = PITCH_CHUNK_STATS["parse_failures"] / max(1, PITCH_CHUNK_STATS["chunks"])
+    logger.info(
+        f"GEMINI chunks | rid={rid} | items={len(items)} | chunk_sizes={[len(c) for c in chunks]} | "
+        f"retried={len(retried)} | rejected={len(rejected)} | missing={missing} | parse_failure_rate={parse_rate:.3f}"
+    )
+    return pitches
+
+class PitchBatcher:
+    """Collects pitch jobs from concurrent requests for up to window_ms and sends them as one prompt."""
+
+    def __init__(self, window_ms: int, max_items: int):
+        self.window_s = max(0, window_ms) / 1000.0
+        self.max_items = max(1, max_items)
+        self._pending: List[Tuple[Dict[str, Any], str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, items: List[Dict[str, Any]], rid: str) -> List[Optional[str]]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for it in items:
+            fut = loop.create_future()
+            self._pending.append((it, rid, fut))
+            futures.append(fut)
+            if len(self._pending) >= self.max_items:
+                self._flush()
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [entry for entry in self._pending if not entry[2].done()]
+        self._pending = []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: List[Tuple[Dict[str, Any], str, asyncio.Future]]) -> None:
+        items = [it for it, _, _ in batch]
+        rids = ",".join(sorted({rid for _, rid, _ in batch}))
+        self.batches += 1
+        self.items += len(items)
+
+        try:
+            model = await get_model()
+            pitches = await _generate_pitches_chunked(model, items, rid=rids)
+        except Exception as e:
+            logger.exception(f"GEMINI batcher flush failed | rid={rids} | items={len(items)} | err={e}")
+            pitches = [None] * len(items)
+        for (_, _, fut), p in zip(batch, pitches):
+            if not fut.done():
+                fut.set_result(p)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": int(self.window_s * 1000),
+            "max_items": self.max_items,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "chunks": dict(PITCH_CHUNK_STATS),
+        }
+
+PITCH_BATCHER = PitchBatcher(PITCH_BATCH_WINDOW_MS, PITCH_BATCH_MAX_ITEMS)
+
+async def generate_sales_copy_batch(items: List[Dict[str, Any]], city: str, category: str, rid: str) -> List[str]:
+    # cache keys only need the model name; the model itself is loaded only when something misses
+    model_name = _current_model_name()
+    if model_name is None:
+        try:
+            await get_model()
+        except Exception as e:
+            logger.warning(f"GEMINI model unavailable before cache lookup | rid={rid} | err={e}")
+        model_name = _MODEL_NAME
+
+    keys = [_pitch_cache_key(it, city, category, model_name) for it in items]
+    try:
+        cached = await PITCH_CACHE.aget_many(keys) if model_name else [None] * len(items)
+    except Exception as e:
+        logger.warning(f"GEMINI pitch cache read failed | rid={rid} | err={e}")
+        cached = [None] * len(items)
+
+    pitches: List[Optional[str]] = [p if isinstance(p, str) and p.strip() else None for p in cached]
+    misses = [i for i, p in enumerate(pitches) if p is None]
+    if misses:
+        generated = await PITCH_BATCHER.submit([{**items[i], "city": city, "category": category} for i in misses], rid)
+        fresh = {}
+        for i, p in zip(misses, generated):
+            if p:
+                pitches[i] = p
+                # the model may have been (re)selected while generating
+                fresh[keys[i] if _MODEL_NAME == model_name else _pitch_cache_key(items[i], city, category, _MODEL_NAME)] = p
+        if fresh and _MODEL_NAME:
+            try:
+                await PITCH_CACHE.aset_many(fresh)
+            except Exception as e:
+                logger.warning(f"GEMINI pitch cache write failed | rid={rid} | err={e}")
+    logger.info(f"GEMINI pitches | rid={rid} | items={len(items)} | cached={len(items) - len(misses)} | generated={len(misses)}")
+    fallbacks = sum(1 for p in pitches if not p)
+    if fallbacks:
+        METRIC_FALLBACKS.inc("gemini", value=fallbacks)
+
+    return [
+        p if p else _fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url"))
+        for it, p in zip(items, pitches)
+    ]
 
 @app.on_event("startup")
 async def _startup():
+    global _MODEL_NAME, _MODEL_SOURCE, _MODEL_OUTPUT_LIMIT
+    t0 = time.perf_counter()
     try:
-        await init_model()
+        cached = _load_model_choice() if GEMINI_STARTUP == "cached" else None
+        if cached:
+            # the SDK import and model object are deferred to the first generation call
+            (_MODEL_NAME, _MODEL_OUTPUT_LIMIT), _MODEL_SOURCE = cached, "cache"
+        elif GEMINI_STARTUP != "lazy":
+            await init_model(validate=GEMINI_STARTUP == "validate")
     except Exception as e:
         logger.exception(f"Startup model init failed | err={e}")
+    logger.info(
+        f"BOOT startup done | ms={int((time.perf_counter() - t0) * 1000)} | imports_ms={_IMPORT_MS} | "
+        f"since_boot_ms={int((time.perf_counter() - _BOOT_T0) * 1000)} | gemini_startup={GEMINI_STARTUP} | "
+        f"model={_MODEL_NAME} | source={_MODEL_SOURCE} | sdk_loaded={_GENAI is not None}"
+    )
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await close_serp_client()
+    await close_probe_client()
 
 @app.middleware("http")
 async def add_request_id(request: Request, call_next):
@@ -325,6 +1551,8 @@ async def add_request_id(request: Request, call_next):
     try:
         response = await call_next(request)
         dt = int((time.time() - t0) * 1000)
+        route = request.scope.get("route")
+        METRIC_REQUEST_LATENCY.observe(dt / 1000.0, getattr(route, "path", "unmatched"), str(response.status_code))
         logger.info(f"REQ end | rid={rid} | status={response.status_code} | ms={dt}")
         response.headers["x-request-id"] = rid
         return response
@@ -339,13 +1567,24 @@ async def debug_gemini():
     try:
         model = await get_model()
     except Exception as e:
-        return {"ok": False, "selected_model": _MODEL_NAME, "error": str(e)}
+        return {"ok": False, "selected_model": _MODEL_NAME, "error": str(e), "limiters": _limiter_snapshot()}
 
+    # the debug call spends real quota, so it goes through the limiter like any other call
+    if not await GEMINI_LIMITER.acquire(0):
+        return {"ok": False, "selected_model": _MODEL_NAME, "error": f"gemini limiter {GEMINI_LIMITER.state}", "limiters": _limiter_snapshot()}
     try:
         r = await model.generate_content_async("Rispondi con una sola parola: OK")
         txt = (r.text or "").strip()
-        return {"ok": True, "selected_model": _MODEL_NAME, "reply": txt}
+        GEMINI_LIMITER.record_success()
+        return {"ok": True, "selected_model": _MODEL_NAME, "reply": txt, "limiters": _limiter_snapshot()}
+    except asyncio.CancelledError:
+        GEMINI_LIMITER.record_abandoned()
+        raise
     except Exception as e:
+        if _is_429(e):
+            GEMINI_LIMITER.record_429(_extract_retry_seconds(e))
+        else:
+            GEMINI_LIMITER.record_failure()
         return {
             "ok": False,
             "selected_model": _MODEL_NAME,
@@ -353,8 +1592,39 @@ async def debug_gemini():
             "error_text": str(e),
             "is_429": _is_429(e),
             "retry_seconds": _extract_retry_seconds(e) if _is_429(e) else None,
+            "limiters": _limiter_snapshot(),
         }
 
+@app.get("/api/v1/debug/cache")
+async def debug_cache():
+    return {
+        "serp": SERP_CACHE.stats(),
+        "pitch": PITCH_CACHE.stats(),
+        "website_probe": PROBE_CACHE.stats(),
+        "pitch_batcher": PITCH_BATCHER.stats(),
+        "lead_store": LEAD_STORE.stats(),
+        "domain_classifier": DOMAIN_CLASSIFIER.stats(),
+    }
+
+def _collect_cache_lookups() -> Dict[Tuple[str, ...], float]:
+    out: Dict[Tuple[str, ...], float] = {}
+    for name, cache in (("serp", SERP_CACHE), ("pitch", PITCH_CACHE), ("probe", PROBE_CACHE)):
+        out[(name, "hit")] = cache.hits
+        out[(name, "miss")] = cache.misses
+    out[("domain", "hit")] = DOMAIN_CLASSIFIER.memo_hits
+    out[("domain", "miss")] = DOMAIN_CLASSIFIER.lookups - DOMAIN_CLASSIFIER.memo_hits
+    return out
+
+def _collect_limiter_rejections() -> Dict[Tuple[str, ...], float]:
+    return {("gemini",): GEMINI_LIMITER.rejected, ("serpapi",): SERPAPI_LIMITER.rejected}
+
+_METRICS.append(_Counter("lead_gen_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"), _collect_cache_lookups))
+_METRICS.append(_Counter("lead_gen_limiter_rejections_total", "Calls rejected by the upstream limiter.", ("upstream",), _collect_limiter_rejections))
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 def _lead_dedupe_key(business_name: str, address: Optional[str], phone: Optional[str]) -> Tuple[str, str, str]:
     return (
         (business_name or "").strip().lower(),
@@ -362,21 +1632,443 @@ def _lead_dedupe_key(business_name: str, address: Optional[str], phone: Optional
         (phone or "").strip().lower(),
     )
 
-@app.get("/api/v1/leads", response_model=List[Lead])
-async def get_leads(
-    request: Request,
-    city: str = Query(..., description="Target City"),
-    categories: List[str] = Query(None, alias="categories"),
-    category_single: Optional[str] = Query(None, alias="category"),
-    limit: int = Query(5, ge=1, le=20),
+async def _in_executor(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, fn, *args)
+
+def _norm_text(s: Optional[str]) -> str:
+    return " ".join((s or "").lower().split())
+
+def _norm_phone(s: Optional[str]) -> str:
+    digits = re.sub(r"\D", "", s or "")
+    if digits.startswith("0039"):
+        digits = digits[4:]
+    elif digits.startswith("39") and len(digits) > 10:
+        digits = digits[2:]
+    return digits
+
+class LeadStore:
+    """SQLite store of every lead the service has delivered."""
+
+    _CHUNK = 400
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leads ("
+                "id INTEGER PRIMARY KEY, norm_name TEXT NOT NULL, norm_address TEXT NOT NULL, norm_phone TEXT NOT NULL, "
+                "business_name TEXT NOT NULL, address TEXT, phone TEXT, current_status TEXT, detected_url TEXT, "
+                "first_seen REAL NOT NULL, last_seen REAL NOT NULL, times_delivered INTEGER NOT NULL DEFAULT 1, "
+                "UNIQUE (norm_name, norm_address, norm_phone))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS leads_norm_name ON leads(norm_name)")
+            # lookups always go through the name; these only added write cost
+            self._conn.execute("DROP INDEX IF EXISTS leads_norm_phone")
+            self._conn.execute("DROP INDEX IF EXISTS leads_norm_address")
+
+    @staticmethod
+    def _norm(it: Dict[str, Any]) -> Tuple[str, str, str]:
+        return (_norm_text(it.get("business_name")), _norm_text(it.get("address")), _norm_phone(it.get("phone")))
+
+    def upsert_many(self, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (*self._norm(it), it["business_name"], it.get("address"), it.get("phone"),
+             it.get("current_status"), it.get("detected_url"), now, now)
+            for it in items
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO leads (norm_name, norm_address, norm_phone, business_name, address, phone, "
+                "current_status, detected_url, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (norm_name, norm_address, norm_phone) DO UPDATE SET "
+                "last_seen = excluded.last_seen, current_status = excluded.current_status, "
+                "detected_url = excluded.detected_url, times_delivered = times_delivered + 1",
+                rows,
+            )
+
+    def seen_mask(self, items: List[Dict[str, Any]]) -> List[bool]:
+        # branches sharing a switchboard number differ by name, so a phone only counts together with the name
+        norms = [self._norm(it) for it in items]
+        names = sorted({n for n, _, _ in norms if n})
+        known_name_phone: Set[Tuple[str, str]] = set()
+        known_name_addr: Set[Tuple[str, str]] = set()
+        with self._lock:
+            for i in range(0, len(names), self._CHUNK):
+                chunk = names[i:i + self._CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT norm_name, norm_address, norm_phone FROM leads WHERE norm_name IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for n, a, p in rows:
+                    known_name_addr.add((n, a))
+                    if p:
+                        known_name_phone.add((n, p))
+        return [((n, p) in known_name_phone) if p else ((n, a) in known_name_addr) for n, a, p in norms]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+        return {"path": self.path, "leads": count}
+
+LEAD_STORE = LeadStore(LEAD_STORE_PATH)
+
+async def _filter_unseen(candidates: List[dict], rid: str) -> List[dict]:
+    try:
+        mask = await _in_executor(LEAD_STORE.seen_mask, candidates)
+    except Exception as e:
+        logger.warning(f"LEADS store lookup failed | rid={rid} | err={e}")
+        return candidates
+    return [it for it, known in zip(candidates, mask) if not known]
+
+async def _record_delivered(items: List[dict], rid: str) -> None:
+    try:
+        await _in_executor(LEAD_STORE.upsert_many, items)
+    except Exception as e:
+        logger.warning(f"LEADS store upsert failed | rid={rid} | items={len(items)} | err={e}")
+
+async def _safe_search(q: str, start: int, rid: str, refresh: bool = False) -> dict:
+    try:
+        data = await search_google_maps(q, start=start, hl="it", refresh=refresh)
+        if not isinstance(data, dict):
+            return {}
+        return data
+    except Exception as e:
+        logger.error(f"LEADS serp_error | rid={rid} | q={q} | err={e}")
+        return {}
+
+def _serp_fetch_failed(data: dict) -> bool:
+    # {} is what a 429, timeout or limiter rejection looks like; "no results" is a real end of results
+    if not data:
+        return True
+    error = str(data.get("error") or "").lower()
+    return bool(error) and "hasn't returned any results" not in error
+
+async def _safe_generate_pitches(chosen: List[dict], city: str, category: str, rid: str, ai: bool) -> List[str]:
+    if not chosen: return []
+    if not ai:
+        METRIC_FALLBACKS.inc("ai_disabled", value=len(chosen))
+        return [_fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url")) for it in chosen]
+
+    try:
+        pitches = await generate_sales_copy_batch(chosen, city=city, category=category, rid=rid)
+        final_pitches = []
+        for i, p in enumerate(pitches):
+            if isinstance(p, str) and p.strip():
+                final_pitches.append(p)
+            else:
+                it = chosen[i]
+                final_pitches.append(_fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url")))
+        return final_pitches
+    except Exception as e:
+        logger.warning(f"LEADS ai_fallback | rid={rid} | category={category} | err={e}")
+        METRIC_FALLBACKS.inc("error", value=len(chosen))
+        return [_fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url")) for it in chosen]
+
+_PROBE_CLIENT: Optional[httpx.AsyncClient] = None
+_PROBE_GLOBAL = asyncio.Semaphore(WEBSITE_PROBE_CONCURRENCY)
+_PROBE_HOST_SLOTS: Dict[str, List[Any]] = {}
+_PROBE_INFLIGHT: Dict[str, asyncio.Task] = {}
+_VIEWPORT_RE = re.compile(rb"<meta[^>]+name\s*=\s*[\"']?viewport", re.IGNORECASE)
+_PROBE_DEAD_STATUSES = {404, 410, 500, 502, 503, 504, 521, 522, 523, 530}
+
+PROBE_CACHE = make_cache(
+    "website_probe", WEBSITE_PROBE_CACHE_BACKEND, WEBSITE_PROBE_CACHE_TTL_S, WEBSITE_PROBE_CACHE_MAX_ENTRIES, WEBSITE_PROBE_CACHE_PATH,
+)
+
+def get_probe_client() -> httpx.AsyncClient:
+    global _PROBE_CLIENT
+    if _PROBE_CLIENT is None or _PROBE_CLIENT.is_closed:
+        _PROBE_CLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(WEBSITE_PROBE_TIMEOUT_S, connect=min(3.0, WEBSITE_PROBE_TIMEOUT_S)),
+            limits=httpx.Limits(
+                max_connections=WEBSITE_PROBE_CONCURRENCY,
+                max_keepalive_connections=WEBSITE_PROBE_CONCURRENCY,
+                keepalive_expiry=15,
+            ),
+            headers={"User-Agent": "Mozilla/5.0 (compatible; LeadGenSniper/2.2; +https://imprese.vercel.app)"},
+        )
+    return _PROBE_CLIENT
+
+async def close_probe_client() -> None:
+    global _PROBE_CLIENT
+    if _PROBE_CLIENT is not None:
+        await _PROBE_CLIENT.aclose()
+    _PROBE_CLIENT = None
+
+class _host_slot:
+    """Per-site concurrency limit, keyed on the registrable domain so shared hosting counts once."""
+
+    def __init__(self, host: str):
+        self.key = DOMAIN_CLASSIFIER.registrable_domain(host)
+
+    async def __aenter__(self):
+        entry = _PROBE_HOST_SLOTS.get(self.key)
+        if entry is None:
+            entry = _PROBE_HOST_SLOTS[self.key] = [asyncio.Semaphore(WEBSITE_PROBE_PER_HOST), 0]
+        entry[1] += 1
+        await entry[0].acquire()
+
+    async def __aexit__(self, *exc):
+        entry = _PROBE_HOST_SLOTS[self.key]
+        entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _PROBE_HOST_SLOTS[self.key]
+
+async def _probe_fetch(client: httpx.AsyncClient, url: str) -> Tuple[int, str, bytes]:
+    """Follows redirects with HEAD, then GETs the final URL reading at most WEBSITE_PROBE_MAX_BYTES."""
+    method = "HEAD"
+    for _ in range(6):
+        body = b""
+        if method == "HEAD":
+            try:
+                resp = await client.head(url)
+            except (httpx.TimeoutException, httpx.ConnectError):
+                raise
+            except httpx.HTTPError:
+                method = "GET"
+                continue
+        else:
+            async with client.stream("GET", url) as resp:
+                if not resp.has_redirect_location:
+                    async for chunk in resp.aiter_bytes():
+                        body += chunk
+                        if len(body) >= WEBSITE_PROBE_MAX_BYTES:
+                            break
+        if resp.has_redirect_location:
+            url = str(resp.url.join(resp.headers["location"]))
+            if DOMAIN_CLASSIFIER.classify([url])[0] == "Directory Only":
+                return resp.status_code, url, b""
+            continue
+        if method == "HEAD":
+            method = "GET"
+            continue
+        return resp.status_code, url, body[:WEBSITE_PROBE_MAX_BYTES]
+    raise httpx.TooManyRedirects(f"more than 5 redirects from {url}")
+
+async def _probe_attempts(client: httpx.AsyncClient, url: str, result: Dict[str, Any]) -> None:
+    attempts = [url] if "://" in url else ["https://" + url, "http://" + url]
+    if url.startswith("https://"):
+        attempts.append("http://" + url[len("https://"):])
+    for target in attempts:
+        try:
+            status, final_url, body = await _probe_fetch(client, target)
+        except httpx.HTTPError as e:
+            result["error"] = f"{type(e).__name__}: {e}"[:200]
+            # plain http is retried only when the TLS/connect step failed, not on a timeout
+            if isinstance(e, httpx.ConnectError):
+                continue
+            result["issues"].append("dead")
+            return
+        result.update(status_code=status, final_url=final_url, error=None)
+        if status in _PROBE_DEAD_STATUSES:
+            result["issues"].append("dead")
+        elif DOMAIN_CLASSIFIER.classify([final_url])[0] == "Directory Only":
+            result["issues"].append("redirects_to_directory")
+        else:
+            if not final_url.startswith("https://"):
+                result["issues"].append("no_https")
+            if body and status < 400 and not _VIEWPORT_RE.search(body):
+                result["issues"].append("no_mobile_viewport")
+        return
+    result["issues"].append("dead")
+
+async def _probe_host(url: str, host: str) -> Dict[str, Any]:
+    client = get_probe_client()
+    t0 = time.time()
+    result: Dict[str, Any] = {"host": host, "status_code": None, "final_url": None, "issues": []}
+    async with _PROBE_GLOBAL, _host_slot(host):
+        try:
+            # redirect hops and the http retry each get the per-request timeout; this caps the whole probe
+            await asyncio.wait_for(_probe_attempts(client, url, result), WEBSITE_PROBE_DEADLINE_S)
+        except asyncio.TimeoutError:
+            result.update(status_code=None, final_url=None, error=f"probe deadline {WEBSITE_PROBE_DEADLINE_S:g}s exceeded")
+            result["issues"] = ["timeout", "dead"]
+    dt = int((time.time() - t0) * 1000)
+    outcome = "timeout" if "timeout" in result["issues"] else "dead" if "dead" in result["issues"] else "ok"
+    METRIC_STAGE_LATENCY.observe(dt / 1000.0, "website_probe", outcome)
+    logger.info(f"PROBE done | host={host} | ms={dt} | status={result['status_code']} | issues={result['issues']}")
+    return result
+
+async def probe_website(url: str) -> Dict[str, Any]:
+    host = _host_of(url)
+    if host is None:
+        return {"host": None, "status_code": None, "final_url": None, "issues": ["dead"]}
+    try:
+        cached = await PROBE_CACHE.aget(host)
+    except Exception as e:
+        logger.warning(f"PROBE cache read failed | host={host} | err={e}")
+        cached = None
+    if isinstance(cached, dict):
+        return cached
+
+    task = _PROBE_INFLIGHT.get(host)
+    if task is None:
+        task = asyncio.create_task(_probe_host(url, host))
+        _PROBE_INFLIGHT[host] = task
+        task.add_done_callback(lambda t: _PROBE_INFLIGHT.pop(host, None))
+    result = await asyncio.shield(task)
+    try:
+        await PROBE_CACHE.aset(host, result, WEBSITE_PROBE_NEGATIVE_TTL_S if "dead" in result["issues"] else None)
+    except Exception as e:
+        logger.warning(f"PROBE cache write failed | host={host} | err={e}")
+    return result
+
+def _status_from_probe(probe: Dict[str, Any]) -> str:
+    issues = probe.get("issues") or []
+    if "dead" in issues:
+        return "Dead Website"
+    if "redirects_to_directory" in issues:
+        return "Directory Only"
+    if "no_https" in issues or "no_mobile_viewport" in issues:
+        return "Outdated Website"
+    return "Has Website"
+
+async def probe_candidates(chosen: List[dict], rid: str) -> None:
+    """Refines "Has Website" candidates in place with the probe verdict and the issues found."""
+    targets = [it for it in chosen if it["current_status"] == "Has Website" and it.get("detected_url")]
+    if not WEBSITE_PROBE or not targets:
+        return
+    t0 = time.time()
+    results = await asyncio.gather(*(probe_website(it["detected_url"]) for it in targets), return_exceptions=True)
+    for it, probe in zip(targets, results):
+        if isinstance(probe, BaseException):
+            logger.warning(f"PROBE failed | rid={rid} | url={it['detected_url']} | err={probe}")
+            continue
+        it["current_status"] = _status_from_probe(probe)
+        if probe.get("issues"):
+            it["website_issues"] = list(probe["issues"])
+    logger.info(f"PROBE batch | rid={rid} | sites={len(targets)} | ms={int((time.time() - t0) * 1000)}")
+
+async def _probe_and_pitch(chosen: List[dict], city: str, category: str, rid: str, ai: bool) -> List[str]:
+    await probe_candidates(chosen, rid)
+    return await _safe_generate_pitches(chosen, city=city, category=category, rid=rid, ai=ai)
+
+def _extract_candidates(local_results: List[dict], seen: Set[Tuple[str, str, str]], include_with_website: bool) -> List[dict]:
+    candidates = []
+    statuses = DOMAIN_CLASSIFIER.classify([item.get("website") for item in local_results])
+    for item, lead_status in zip(local_results, statuses):
+        title = (item.get("title") or item.get("name") or "").strip()
+        if not title: continue
+
+        address = item.get("address")
+        phone = item.get("phone")
+        website = item.get("website")
+        dedupe_key = _lead_dedupe_key(title, address, phone)
+
+        if dedupe_key in seen: continue
+
+        if lead_status == "Has Website" and not include_with_website: lead_status = None
+
+        if lead_status:
+            candidates.append({
+                "business_name": title, "address": address, "phone": phone,
+                "rating": item.get("rating"), "reviews": item.get("reviews"),
+                "current_status": lead_status, "detected_url": website,
+                "dedupe_key": dedupe_key
+            })
+    return candidates
+
+def _lead_from_candidate(it: dict, pitch: str) -> Lead:
+    return Lead(
+        business_name=it["business_name"], address=it["address"], phone=it["phone"],
+        rating=it["rating"], reviews=it["reviews"], current_status=it["current_status"],
+        detected_url=it["detected_url"], sales_pitch=pitch, website_issues=it.get("website_issues"),
+    )
+
+async def iter_lead_batches(
+    rid: str,
+    city: str,
+    norm_categories: List[str],
+    limit: int,
     country: str = "Italia",
-    include_with_website: bool = Query(False),
-    ai: bool = Query(True),
-):
-    rid = getattr(request.state, "rid", str(uuid.uuid4()))
-    results: List["Lead"] = []
-    seen: Set[Tuple[str, str, str]] = set()
+    include_with_website: bool = False,
+    ai: bool = True,
+    refresh: bool = False,
+    exclude_seen: bool = False,
+    seen: Optional[Set[Tuple[str, str, str]]] = None,
+    upstream_slots: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[List[Lead]]:
+    """Yields lead batches in plan order while later SERP pages and pitches are still in flight."""
+    seen = set() if seen is None else seen
+    reserved = 0
+    batches: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(PITCH_MAX_INFLIGHT)
+
+    async def _search(q: str, start: int) -> dict:
+        async with upstream_slots or nullcontext():
+            return await _safe_search(q, start=start, rid=rid, refresh=refresh)
+
+    async def _pitch(chosen: List[dict], category: str) -> List[str]:
+        async with upstream_slots or nullcontext():
+            return await _probe_and_pitch(chosen, city=city, category=category, rid=rid, ai=ai)
+
+    async def _produce() -> None:
+        nonlocal reserved
+        planner = SerpFetchPlanner(
+            _search,
+            [(category, f"{category} {city} {country}".strip()) for category in norm_categories],
+            remaining=lambda: limit - reserved,
+        )
+        try:
+            async with aclosing(planner.pages()) as pages:
+                async for category, start, data in pages:
+                    if reserved >= limit: break
+
+                    local_results = data.get("local_results", [])
+                    if not local_results: continue
+
+                    candidates = _extract_candidates(local_results, seen, include_with_website)
+                    if candidates and exclude_seen:
+                        candidates = await _filter_unseen(candidates, rid)
+                        # a pipeline sharing `seen` may have reserved the same leads during the await
+                        candidates = [it for it in candidates if it["dedupe_key"] not in seen]
+                    if not candidates: continue
+
+                    chosen = candidates[:limit - reserved]
+                    reserved += len(chosen)
+                    for it in chosen:
+                        seen.add(it["dedupe_key"])
+
+                    await slots.acquire()
+                    task = asyncio.create_task(_pitch(chosen, category))
+                    batches.put_nowait((chosen, task))
+        finally:
+            batches.put_nowait(None)
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            entry = await batches.get()
+            if entry is None:
+                break
+            chosen, task = entry
+            try:
+                pitches = await task
+            finally:
+                slots.release()
+            await _record_delivered(chosen, rid)
+            yield [_lead_from_candidate(it, pitch) for it, pitch in zip(chosen, pitches)]
+        await producer
+    finally:
+        pending = [producer] if not producer.done() else []
+        while not batches.empty():
+            entry = batches.get_nowait()
+            if entry is not None:
+                pending.append(entry[1])
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
 
+def _normalize_categories(categories: Optional[List[str]], category_single: Optional[str], max_categories: int = 3) -> List[str]:
     raw_categories = []
     if categories:
         for item in categories:
@@ -403,95 +2095,606 @@ async def get_leads(
     if not norm_categories:
         norm_categories = ["Ristorante"]
     
-    if len(norm_categories) > 3:
-        norm_categories = norm_categories[:3]
+    if len(norm_categories) > max_categories:
+        norm_categories = norm_categories[:max_categories]
 
-    logger.info(f"LEADS start | rid={rid} | city={city} | TARGET={norm_categories}")
+    return norm_categories
 
-    async def _safe_search(q: str, start: int) -> dict:
-        try:
-            data = await search_google_maps(q, start=start, hl="it")
-            if not isinstance(data, dict):
-                return {}
-            return data
-        except Exception as e:
-            logger.error(f"LEADS serp_error | rid={rid} | q={q} | err={e}")
-            return {} 
+_LEADS_INFLIGHT: Dict[Tuple[Any, ...], asyncio.Task] = {}
+
+def _leads_flight_key(city: str, norm_categories: List[str], limit: int, country: str, include_with_website: bool, ai: bool, refresh: bool, exclude_seen: bool) -> Tuple[Any, ...]:
+    return ((city or "").strip(), tuple(norm_categories), limit, (country or "").strip(), include_with_website, ai, refresh, exclude_seen)
+
+def _leads_flight_done(key: Tuple[Any, ...], task: asyncio.Task) -> None:
+    if _LEADS_INFLIGHT.get(key) is task:
+        del _LEADS_INFLIGHT[key]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"LEADS shared computation failed | key={key} | err={task.exception()}")
+
+async def _collect_leads(
+    rid: str,
+    city: str,
+    norm_categories: List[str],
+    limit: int,
+    country: str = "Italia",
+    include_with_website: bool = False,
+    ai: bool = True,
+    refresh: bool = False,
+    exclude_seen: bool = False,
+) -> List[Lead]:
+    results: List[Lead] = []
+    t0 = time.time()
+    lead_batches = iter_lead_batches(
+        rid, city, norm_categories, limit,
+        country=country, include_with_website=include_with_website, ai=ai, refresh=refresh, exclude_seen=exclude_seen,
+    )
+    async with aclosing(lead_batches) as batches:
+        async for batch in batches:
+            results.extend(batch)
+    METRIC_STAGE_LATENCY.observe(time.time() - t0, "pipeline", "ok")
+    return results
+
+@app.get("/api/v1/leads", response_model=List[Lead])
+async def get_leads(
+    request: Request,
+    city: str = Query(..., description="Target City"),
+    categories: List[str] = Query(None, alias="categories"),
+    category_single: Optional[str] = Query(None, alias="category"),
+    limit: int = Query(5, ge=1, le=20),
+    country: str = "Italia",
+    include_with_website: bool = Query(False),
+    ai: bool = Query(True),
+    refresh: bool = Query(False, description="Bypass the SerpAPI response cache"),
+    exclude_seen: bool = Query(False, description="Skip leads already delivered by earlier requests"),
+):
+    rid = getattr(request.state, "rid", str(uuid.uuid4()))
+
+    norm_categories = _normalize_categories(categories, category_single)
+    key = _leads_flight_key(city, norm_categories, limit, country, include_with_website, ai, refresh, exclude_seen)
+
+    task = _LEADS_INFLIGHT.get(key)
+    if task is None:
+        logger.info(f"LEADS start | rid={rid} | city={city} | TARGET={norm_categories}")
+        task = asyncio.create_task(_collect_leads(
+            rid, city, norm_categories, limit,
+            country=country, include_with_website=include_with_website, ai=ai, refresh=refresh, exclude_seen=exclude_seen,
+        ))
+        _LEADS_INFLIGHT[key] = task
+        task.add_done_callback(lambda t: _leads_flight_done(key, t))
+    else:
+        logger.info(f"LEADS coalesced | rid={rid} | city={city} | TARGET={norm_categories}")
+
+    # shield: a waiter that disconnects must not cancel the computation the others are awaiting
+    results = list(await asyncio.shield(task))
+
+    METRIC_LEADS_RETURNED.observe(len(results), "leads")
+    logger.info(f"LEADS done | rid={rid} | returned={len(results)}")
+    return results
 
-    async def _safe_generate_pitches(chosen: List[dict], city: str, category: str) -> List[str]:
-        if not chosen: return []
-        if not ai:
-            return [_fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url")) for it in chosen]
+def _stream_event(fmt: str, event: Dict[str, Any]) -> str:
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
 
+@app.get("/api/v1/leads/stream")
+async def stream_leads(
+    request: Request,
+    city: str = Query(..., description="Target City"),
+    categories: List[str] = Query(None, alias="categories"),
+    category_single: Optional[str] = Query(None, alias="category"),
+    limit: int = Query(5, ge=1, le=20),
+    country: str = "Italia",
+    include_with_website: bool = Query(False),
+    ai: bool = Query(True),
+    refresh: bool = Query(False, description="Bypass the SerpAPI response cache"),
+    exclude_seen: bool = Query(False, description="Skip leads already delivered by earlier requests"),
+    fmt: str = Query("ndjson", alias="format", description="ndjson or sse"),
+):
+    fmt = (fmt or "ndjson").strip().lower()
+    if fmt not in {"ndjson", "sse"}:
+        raise HTTPException(status_code=422, detail="format must be 'ndjson' or 'sse'")
+
+    rid = getattr(request.state, "rid", str(uuid.uuid4()))
+    norm_categories = _normalize_categories(categories, category_single)
+
+    async def _events():
+        t0 = time.time()
+        returned = 0
+        logger.info(f"LEADS stream start | rid={rid} | city={city} | TARGET={norm_categories} | format={fmt}")
+        yield _stream_event(fmt, {"type": "start", "rid": rid, "city": city, "categories": norm_categories, "limit": limit})
+        lead_batches = iter_lead_batches(
+            rid, city, norm_categories, limit,
+            country=country, include_with_website=include_with_website, ai=ai, refresh=refresh, exclude_seen=exclude_seen,
+        )
         try:
-            pitches = await generate_sales_copy_batch(chosen, city=city, category=category, rid=rid)
-            final_pitches = []
-            for i, p in enumerate(pitches):
-                if isinstance(p, str) and p.strip():
-                    final_pitches.append(p)
-                else:
-                    it = chosen[i]
-                    final_pitches.append(_fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url")))
-            return final_pitches
+            async with aclosing(lead_batches) as batches:
+                async for batch in batches:
+                    for lead in batch:
+                        yield _stream_event(fmt, {"type": "lead", "index": returned, "lead": jsonable_encoder(lead)})
+                        returned += 1
+                    yield _stream_event(fmt, {"type": "progress", "returned": returned, "limit": limit})
         except Exception as e:
-            logger.warning(f"LEADS ai_fallback | rid={rid} | category={category} | err={e}")
-            return [_fallback_pitch(it["business_name"], city, category, it["current_status"], it.get("detected_url")) for it in chosen]
+            logger.exception(f"LEADS stream failed | rid={rid} | returned={returned} | err={e}")
+            yield _stream_event(fmt, {"type": "error", "error": str(e), "returned": returned})
+        dt = int((time.time() - t0) * 1000)
+        METRIC_LEADS_RETURNED.observe(returned, "stream")
+        logger.info(f"LEADS stream done | rid={rid} | returned={returned} | ms={dt}")
+        yield _stream_event(fmt, {"type": "end", "returned": returned, "limit": limit, "ms": dt})
+
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        _events(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "x-request-id": rid},
+    )
+
+class JobRequest(BaseModel):
+    city: str
+    categories: List[str] = []
+    limit: int = 200
+    country: str = "Italia"
+    include_with_website: bool = False
+    ai: bool = True
+    exclude_seen: bool = False
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    city: str
+    categories: List[str]
+    limit: int
+    found: int
+    pages_done: int
+    categories_done: int
+    error: Optional[str]
+    created_at: float
+    updated_at: float
+
+class JobLeadsPage(BaseModel):
+    job_id: str
+    status: str
+    offset: int
+    limit: int
+    total: int
+    items: List[Lead]
+
+class JobStore:
+    """SQLite store for background jobs, their per-category page cursors and leads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, params TEXT NOT NULL, status TEXT NOT NULL, found INTEGER NOT NULL DEFAULT 0, "
+                "pages_done INTEGER NOT NULL DEFAULT 0, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_cursors ("
+                "job_id TEXT NOT NULL, category_idx INTEGER NOT NULL, next_start INTEGER NOT NULL, done INTEGER NOT NULL, "
+                "PRIMARY KEY (job_id, category_idx))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_leads ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, dedupe_key TEXT NOT NULL, lead TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, seq))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+
+    def create(self, params: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, params, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, json.dumps(params, ensure_ascii=False), now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, params, status, found, pages_done, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            categories_done = self._conn.execute(
+                "SELECT COUNT(*) FROM job_cursors WHERE job_id = ? AND done = 1", (job_id,)
+            ).fetchone()[0]
+        return {
+            "job_id": row[0], "params": json.loads(row[1]), "status": row[2], "found": row[3],
+            "pages_done": row[4], "error": row[5], "created_at": row[6], "updated_at": row[7],
+            "categories_done": categories_done,
+        }
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def requeue_failed(self, job_id: str) -> bool:
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, updated_at = ? WHERE id = ? AND status = 'failed'",
+                (time.time(), job_id),
+            )
+        return cur.rowcount == 1
+
+    def cursors(self, job_id: str) -> Dict[int, Tuple[int, bool]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT category_idx, next_start, done FROM job_cursors WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {r[0]: (r[1], bool(r[2])) for r in rows}
+
+    def lead_keys(self, job_id: str) -> List[Tuple[str, str, str]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT dedupe_key FROM job_leads WHERE job_id = ?", (job_id,)).fetchall()
+        return [tuple(json.loads(r[0])) for r in rows]
 
-    for category in norm_categories:
-        if len(results) >= limit: break
+    def save_page(self, job_id: str, category_idx: int, next_start: int, done: bool, leads: List[Tuple[Tuple[str, str, str], Dict[str, Any]]]) -> None:
+        with self._lock, self._conn:
+            seq = self._conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM job_leads WHERE job_id = ?", (job_id,)).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO job_leads (job_id, seq, dedupe_key, lead) VALUES (?, ?, ?, ?)",
+                [
+                    (job_id, seq + i, json.dumps(list(key), ensure_ascii=False), json.dumps(lead, ensure_ascii=False))
+                    for i, (key, lead) in enumerate(leads)
+                ],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_cursors (job_id, category_idx, next_start, done) VALUES (?, ?, ?, ?)",
+                (job_id, category_idx, next_start, int(done)),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET found = found + ?, pages_done = pages_done + 1, updated_at = ? WHERE id = ?",
+                (len(leads), time.time(), job_id),
+            )
 
+    def leads(self, job_id: str, offset: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM job_leads WHERE job_id = ?", (job_id,)).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT lead FROM job_leads WHERE job_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            ).fetchall()
+        return total, [json.loads(r[0]) for r in rows]
+
+JOB_STORE = JobStore(JOBS_DB_PATH)
+_JOB_QUEUE: "asyncio.Queue[str]" = asyncio.Queue()
+_JOB_WORKERS: List[asyncio.Task] = []
+
+def _job_status(job: Dict[str, Any]) -> JobStatus:
+    params = job["params"]
+    return JobStatus(
+        job_id=job["job_id"], status=job["status"], city=params["city"], categories=params["categories"],
+        limit=params["limit"], found=job["found"], pages_done=job["pages_done"],
+        categories_done=job["categories_done"], error=job["error"],
+        created_at=job["created_at"], updated_at=job["updated_at"],
+    )
+
+async def _run_job(job_id: str) -> None:
+    job = await _in_executor(JOB_STORE.get, job_id)
+    if job is None:
+        return
+    params = job["params"]
+    rid = f"job-{job_id}"
+    city, limit, country = params["city"], params["limit"], params["country"]
+
+    cursors = await _in_executor(JOB_STORE.cursors, job_id)
+    seen: Set[Tuple[str, str, str]] = set(await _in_executor(JOB_STORE.lead_keys, job_id))
+    found = job["found"]
+    await _in_executor(JOB_STORE.set_status, job_id, "running")
+    logger.info(f"JOB start | rid={rid} | city={city} | TARGET={params['categories']} | limit={limit} | found={found}")
+
+    for idx, category in enumerate(params["categories"]):
+        next_start, done = cursors.get(idx, (0, False))
         q = f"{category} {city} {country}".strip()
-        start = 0
-        
-        while len(results) < limit and start < 60:
-            data = await _safe_search(q, start=start)
+
+        attempts = 0
+        while not done and found < limit and next_start < JOB_MAX_START:
+            data = await _safe_search(q, start=next_start, rid=rid)
+            if _serp_fetch_failed(data):
+                # the cursor stays put: a resumed job retries this page instead of skipping the category
+                attempts += 1
+                if attempts > JOB_FETCH_RETRIES:
+                    raise RuntimeError(f"SerpAPI fetch failed {attempts} times | q={q} | start={next_start} | error={data.get('error')}")
+                backoff = min(JOB_FETCH_BACKOFF_MAX_S, 2.0 ** attempts)
+                logger.warning(f"JOB fetch failed, retrying | rid={rid} | q={q} | start={next_start} | attempt={attempts} | backoff_s={backoff}")
+                await asyncio.sleep(backoff)
+                continue
+            attempts = 0
             local_results = data.get("local_results", [])
-            
-            if not local_results: break
-
-            candidates = []
-            for item in local_results:
-                title = (item.get("title") or item.get("name") or "").strip()
-                if not title: continue
-
-                address = item.get("address")
-                phone = item.get("phone")
-                website = item.get("website")
-                dedupe_key = _lead_dedupe_key(title, address, phone)
-                
-                if dedupe_key in seen: continue
-
-                lead_status = None
-                if not website: lead_status = "No Website"
-                elif not is_valid_website(website): lead_status = "Directory Only"
-                elif include_with_website: lead_status = "Has Website"
-
-                if lead_status:
-                    candidates.append({
-                        "business_name": title, "address": address, "phone": phone,
-                        "rating": item.get("rating"), "reviews": item.get("reviews"),
-                        "current_status": lead_status, "detected_url": website,
-                        "dedupe_key": dedupe_key
-                    })
-
-            if candidates:
-                remaining = limit - len(results)
-                chosen = candidates[:remaining]
-                pitches = await _safe_generate_pitches(chosen, city=city, category=category)
-
-                for it, pitch in zip(chosen, pitches):
-                    seen.add(it["dedupe_key"])
-                    results.append(Lead(
-                        business_name=it["business_name"], address=it["address"], phone=it["phone"],
-                        rating=it["rating"], reviews=it["reviews"], current_status=it["current_status"],
-                        detected_url=it["detected_url"], sales_pitch=pitch,
-                    ))
-
-            start += 20
-            if len(local_results) < 20: break
 
-    logger.info(f"LEADS done | rid={rid} | returned={len(results)}")
-    return results
+            chosen: List[dict] = []
+            if local_results:
+                candidates = _extract_candidates(local_results, seen, params["include_with_website"])
+                if candidates and params.get("exclude_seen"):
+                    candidates = await _filter_unseen(candidates, rid)
+                chosen = candidates[:limit - found]
+            pitches = await _probe_and_pitch(chosen, city=city, category=category, rid=rid, ai=params["ai"])
+
+            leads = [(it["dedupe_key"], jsonable_encoder(_lead_from_candidate(it, pitch))) for it, pitch in zip(chosen, pitches)]
+            next_start += SERP_PAGE_SIZE
+            done = len(local_results) < SERP_PAGE_SIZE or next_start >= JOB_MAX_START
+            await _in_executor(JOB_STORE.save_page, job_id, idx, next_start, done, leads)
+            await _record_delivered(chosen, rid)
+
+            for it in chosen:
+                seen.add(it["dedupe_key"])
+            found += len(chosen)
+
+        if found >= limit:
+            break
+
+    await _in_executor(JOB_STORE.set_status, job_id, "done")
+    METRIC_LEADS_RETURNED.observe(found, "job")
+    logger.info(f"JOB done | rid={rid} | found={found}")
+
+async def _job_worker(n: int) -> None:
+    while True:
+        job_id = await _JOB_QUEUE.get()
+        try:
+            await _run_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"JOB failed | worker={n} | job_id={job_id} | err={e}")
+            await _in_executor(JOB_STORE.set_status, job_id, "failed", str(e))
+        finally:
+            _JOB_QUEUE.task_done()
+
+@app.on_event("startup")
+async def _start_job_workers():
+    for job_id in await _in_executor(JOB_STORE.unfinished):
+        logger.info(f"JOB resume | job_id={job_id}")
+        _JOB_QUEUE.put_nowait(job_id)
+    for n in range(JOBS_CONCURRENCY):
+        _JOB_WORKERS.append(asyncio.create_task(_job_worker(n)))
+
+@app.on_event("shutdown")
+async def _stop_job_workers():
+    # running jobs keep their cursors in the store and are resumed on the next startup; failed jobs
+    # stay failed until POST /api/v1/jobs/{job_id}/resume, so a lasting error does not burn quota on every boot
+    for t in _JOB_WORKERS:
+        t.cancel()
+    await asyncio.gather(*_JOB_WORKERS, return_exceptions=True)
+    _JOB_WORKERS.clear()
+
+@app.post("/api/v1/jobs", response_model=JobStatus, status_code=202)
+async def create_job(req: JobRequest):
+    city = (req.city or "").strip()
+    if not city:
+        raise HTTPException(status_code=422, detail="city is required")
+    if not 1 <= req.limit <= JOB_MAX_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {JOB_MAX_LIMIT}")
+
+    params = {
+        "city": city,
+        "categories": _normalize_categories(req.categories, None, max_categories=JOB_MAX_CATEGORIES),
+        "limit": req.limit,
+        "country": req.country,
+        "include_with_website": req.include_with_website,
+        "ai": req.ai,
+        "exclude_seen": req.exclude_seen,
+    }
+    job_id = await _in_executor(JOB_STORE.create, params)
+    _JOB_QUEUE.put_nowait(job_id)
+    logger.info(f"JOB queued | job_id={job_id} | params={_safe_json(params)}")
+    return _job_status(await _in_executor(JOB_STORE.get, job_id))
+
+@app.get("/api/v1/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job = await _in_executor(JOB_STORE.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return _job_status(job)
+
+@app.post("/api/v1/jobs/{job_id}/resume", response_model=JobStatus, status_code=202)
+async def resume_job(job_id: str):
+    job = await _in_executor(JOB_STORE.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not await _in_executor(JOB_STORE.requeue_failed, job_id):
+        raise HTTPException(status_code=409, detail=f"only failed jobs can be resumed, job is {job['status']}")
+    _JOB_QUEUE.put_nowait(job_id)
+    logger.info(f"JOB resume requested | job_id={job_id} | error={job['error']}")
+    return _job_status(await _in_executor(JOB_STORE.get, job_id))
+
+@app.get("/api/v1/jobs/{job_id}/leads", response_model=JobLeadsPage)
+async def get_job_leads(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+):
+    job = await _in_executor(JOB_STORE.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    total, items = await _in_executor(JOB_STORE.leads, job_id, offset, limit)
+    return JobLeadsPage(
+        job_id=job_id, status=job["status"], offset=offset, limit=limit, total=total,
+        items=[Lead(**it) for it in items],
+    )
+
+class ExportRequest(BaseModel):
+    cities: List[str]
+    categories: List[str]
+    limit_per_search: int = 20
+    country: str = "Italia"
+    include_with_website: bool = False
+    ai: bool = True
+    exclude_seen: bool = False
+    refresh: bool = False
+    format: str = "csv"
+
+EXPORT_COLUMNS = [
+    "city", "category", "business_name", "address", "phone", "rating", "reviews",
+    "current_status", "detected_url", "website_issues", "sales_pitch",
+]
+
+# held around each SERP fetch and pitch batch of every export, so concurrent exports split one upstream
+# budget and an export stalled on a slow reader holds none of it
+_EXPORT_SLOTS = asyncio.Semaphore(EXPORT_CONCURRENCY)
+
+def _openpyxl_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _export_list(values: List[str], what: str, max_n: int) -> List[str]:
+    out: List[str] = []
+    for v in values or []:
+        for part in str(v).split(","):
+            part = part.strip()
+            if part and part.lower() not in {x.lower() for x in out}:
+                out.append(part)
+    if not out:
+        raise HTTPException(status_code=422, detail=f"{what} is required")
+    if len(out) > max_n:
+        raise HTTPException(status_code=422, detail=f"at most {max_n} {what} per export")
+    return out
+
+def _export_row(city: str, category: str, lead: Lead) -> List[Any]:
+    return [
+        city, category, lead.business_name, lead.address, lead.phone, lead.rating, lead.reviews,
+        lead.current_status, lead.detected_url, "; ".join(lead.website_issues or []), lead.sales_pitch,
+    ]
+
+async def iter_export_rows(rid: str, req: ExportRequest, cities: List[str], categories: List[str]) -> AsyncIterator[List[List[Any]]]:
+    """Yields export rows batch by batch while the city x category grid runs."""
+    grid = iter([(city, category) for city in cities for category in categories])
+    seen: Set[Tuple[str, str, str]] = set()
+    out: asyncio.Queue = asyncio.Queue()
+    credits = asyncio.Semaphore(EXPORT_CONCURRENCY * 2)
+    n_workers = min(EXPORT_CONCURRENCY, len(cities) * len(categories))
+
+    async def _cell(city: str, category: str) -> None:
+        lead_batches = iter_lead_batches(
+            rid, city, [category], req.limit_per_search,
+            country=req.country, include_with_website=req.include_with_website, ai=req.ai,
+            refresh=req.refresh, exclude_seen=req.exclude_seen, seen=seen, upstream_slots=_EXPORT_SLOTS,
+        )
+        async with aclosing(lead_batches) as batches:
+            async for batch in batches:
+                await credits.acquire()
+                out.put_nowait([_export_row(city, category, lead) for lead in batch])
+
+    async def _worker() -> None:
+        try:
+            for city, category in grid:
+                try:
+                    await _cell(city, category)
+                except Exception as e:
+                    logger.exception(f"EXPORT search failed | rid={rid} | city={city} | category={category} | err={e}")
+        finally:
+            out.put_nowait(None)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(n_workers)]
+    try:
+        running = n_workers
+        while running:
+            rows = await out.get()
+            if rows is None:
+                running -= 1
+                continue
+            credits.release()
+            yield rows
+    finally:
+        for t in workers:
+            t.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+async def _export_csv(rows: AsyncIterator[List[List[Any]]]) -> AsyncIterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buf.getvalue()
+    async with aclosing(rows) as batches:
+        async for batch in batches:
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows(batch)
+            yield buf.getvalue()
+
+async def _export_xlsx(rows: AsyncIterator[List[List[Any]]]) -> AsyncIterator[bytes]:
+    # the xlsx zip can only be written once complete: rows go to openpyxl's write-only temp
+    # files while the grid runs, then the finished file is streamed from disk
+    import openpyxl
+    import tempfile
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("leads")
+    ws.append(EXPORT_COLUMNS)
+    async with aclosing(rows) as batches:
+        async for batch in batches:
+            for row in batch:
+                ws.append(row)
+    with tempfile.TemporaryFile() as f:
+        await _in_executor(wb.save, f)
+        f.seek(0)
+        while True:
+            chunk = await _in_executor(f.read, 1 << 16)
+            if not chunk:
+                break
+            yield chunk
+
+@app.post("/api/v1/export")
+async def export_leads(request: Request, req: ExportRequest):
+    rid = getattr(request.state, "rid", str(uuid.uuid4()))
+    fmt = (req.format or "csv").strip().lower()
+    if fmt not in {"csv", "xlsx"}:
+        raise HTTPException(status_code=422, detail="format must be 'csv' or 'xlsx'")
+    if fmt == "xlsx" and not _openpyxl_available():
+        raise HTTPException(status_code=422, detail="xlsx export requires openpyxl on the server")
+    if not 1 <= req.limit_per_search <= EXPORT_MAX_PER_SEARCH:
+        raise HTTPException(status_code=422, detail=f"limit_per_search must be between 1 and {EXPORT_MAX_PER_SEARCH}")
+    cities = _export_list(req.cities, "cities", EXPORT_MAX_CITIES)
+    categories = _export_list(req.categories, "categories", EXPORT_MAX_CATEGORIES)
+
+    async def _counted() -> AsyncIterator[List[List[Any]]]:
+        t0 = time.time()
+        returned = 0
+        logger.info(f"EXPORT start | rid={rid} | cities={len(cities)} | categories={len(categories)} | per_search={req.limit_per_search} | ai={req.ai} | format={fmt}")
+        async with aclosing(iter_export_rows(rid, req, cities, categories)) as batches:
+            async for batch in batches:
+                returned += len(batch)
+                yield batch
+        METRIC_LEADS_RETURNED.observe(returned, "export")
+        logger.info(f"EXPORT done | rid={rid} | returned={returned} | ms={int((time.time() - t0) * 1000)}")
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if fmt == "xlsx":
+        body = _export_xlsx(_counted())
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = _export_csv(_counted())
+        media_type = "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="leads-{stamp}.{fmt}"',
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "x-request-id": rid,
+        },
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# main.py reads its configuration at import time; keep tests off the network and out of the cwd
+_TMP = tempfile.mkdtemp(prefix="lead-gen-tests-")
+os.environ.setdefault("SERPAPI_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("GEMINI_STARTUP", "lazy")
+os.environ.setdefault("WEBSITE_PROBE", "0")
+for name in ("SERP", "PITCH", "WEBSITE_PROBE"):
+    os.environ.setdefault(f"{name}_CACHE_BACKEND", "memory")
+os.environ.setdefault("LEAD_STORE_PATH", os.path.join(_TMP, "leads.sqlite3"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_TMP, "jobs.sqlite3"))
+os.environ.setdefault("GEMINI_MODEL_CACHE_PATH", os.path.join(_TMP, "gemini_model.json"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
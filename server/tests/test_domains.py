@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+import main
+
+def _write(text):
+    path = os.path.join(tempfile.mkdtemp(), "list.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def test_url_entry_in_blocklist_blocks_its_host():
+    path = _write("https://www.paginegialle.it/milano/bar  # pasted from the browser\nbrand.*\n")
+    dc = main.DomainClassifier(set(), path, None, 0, 100)
+    assert dc.classify(["https://m.paginegialle.it/x", "https://brand.de", "https://bar.it"]) == [
+        "Directory Only", "Directory Only", "Has Website",
+    ]
+
+def test_suffix_file_strips_double_slash_comments():
+    suffixes = _write("// ===BEGIN ICANN DOMAINS===\nexample.it // private registry\n")
+    blocklist = _write("shop.example.it\n")
+    dc = main.DomainClassifier(set(), blocklist, suffixes, 0, 100)
+    assert dc.classify(["https://a.shop.example.it", "https://other.example.it"]) == ["Directory Only", "Has Website"]
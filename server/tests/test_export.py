@@ -0,0 +1,75 @@
+import asyncio
+
+import main
+
+def _page(n):
+    return {"local_results": [
+        {"title": f"Bar {k}", "address": f"Via Roma {k}", "phone": f"02 {k:04d}", "website": None} for k in range(n)
+    ]}
+
+def test_shared_seen_dedupes_across_filter_unseen_await(monkeypatch):
+    async def search(q, start, rid, refresh=False):
+        return _page(3) if start == 0 else {"local_results": []}
+
+    async def slow_filter(candidates, rid):
+        await asyncio.sleep(0.01)
+        return candidates
+
+    monkeypatch.setattr(main, "_safe_search", search)
+    monkeypatch.setattr(main, "_filter_unseen", slow_filter)
+
+    async def run():
+        seen = set()
+
+        async def collect(category):
+            leads = []
+            async for batch in main.iter_lead_batches("t", "Milano", [category], 10, ai=False, exclude_seen=True, seen=seen):
+                leads.extend(batch)
+            return leads
+
+        return await asyncio.gather(collect("Bar"), collect("Pub"))
+
+    a, b = asyncio.run(run())
+    assert len(a) + len(b) == 3
+
+def test_exports_share_one_upstream_budget_even_when_stalled(monkeypatch):
+    active = {"now": 0, "max": 0}
+
+    async def _upstream():
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+
+    async def search(q, start, rid, refresh=False):
+        await _upstream()
+        return {"local_results": [
+            {"title": f"{q} {start} {k}", "address": "a", "phone": None, "website": None} for k in range(20)
+        ]}
+
+    async def pitch(chosen, city, category, rid, ai):
+        await _upstream()
+        return ["pitch"] * len(chosen)
+
+    monkeypatch.setattr(main, "_safe_search", search)
+    monkeypatch.setattr(main, "_probe_and_pitch", pitch)
+    monkeypatch.setattr(main, "EXPORT_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "PITCH_MAX_INFLIGHT", 4)
+
+    async def run():
+        monkeypatch.setattr(main, "_EXPORT_SLOTS", asyncio.Semaphore(2))
+        req = main.ExportRequest(cities=["Milano", "Roma"], categories=["Bar", "Pub"], limit_per_search=60, ai=False)
+        stalled = main.iter_export_rows("a", req, ["Milano", "Roma"], ["Bar", "Pub"])
+        other = main.iter_export_rows("b", req, ["Torino", "Napoli"], ["Bar", "Pub"])
+        try:
+            await stalled.__anext__()
+            rows = 0
+            async for batch in other:
+                rows += len(batch)
+            assert rows == 4 * 60
+        finally:
+            await stalled.aclose()
+            await other.aclose()
+
+    asyncio.run(run())
+    assert active["max"] <= 2
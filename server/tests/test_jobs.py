@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+import main
+
+def _store():
+    return main.JobStore(os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+
+def _params():
+    return {"city": "Milano", "categories": ["Bar"], "limit": 10, "country": "Italia",
+            "include_with_website": False, "ai": False, "exclude_seen": False}
+
+def test_failed_jobs_are_not_resumed_on_startup():
+    store = _store()
+    queued = store.create(_params())
+    failed = store.create(_params())
+    store.set_status(failed, "failed", "quota")
+    assert store.unfinished() == [queued]
+
+def test_requeue_failed_only_applies_to_failed_jobs():
+    store = _store()
+    job_id = store.create(_params())
+    assert store.requeue_failed(job_id) is False
+    store.set_status(job_id, "failed", "quota")
+    assert store.requeue_failed(job_id) is True
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["error"] is None
+    assert job_id in store.unfinished()
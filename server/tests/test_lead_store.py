@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+import main
+
+def _store():
+    return main.LeadStore(os.path.join(tempfile.mkdtemp(), "leads.sqlite3"))
+
+def _lead(name, address=None, phone=None):
+    return {"business_name": name, "address": address, "phone": phone}
+
+def test_shared_phone_does_not_hide_other_branches():
+    store = _store()
+    store.upsert_many([_lead("Pizzeria Da Mario Centro", "Via Roma 1", "02 1234567")])
+    mask = store.seen_mask([
+        _lead("Pizzeria Da Mario Centro", "Via Roma 1", "+39 02 1234567"),
+        _lead("Pizzeria Da Mario Navigli", "Via Vigevano 3", "02 1234567"),
+    ])
+    assert mask == [True, False]
+
+def test_without_phone_name_and_address_must_match():
+    store = _store()
+    store.upsert_many([_lead("Bar Sport", "Via Roma 1")])
+    assert store.seen_mask([_lead("Bar Sport", "Via Roma 1"), _lead("Bar Sport", "Via Po 2")]) == [True, False]
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import main
+from main import UpstreamLimiter
+
+def _run(coro):
+    return asyncio.run(coro)
+
+def _half_open(lim: UpstreamLimiter) -> None:
+    lim.record_429(1)
+    lim.open_until = time.monotonic() - 0.01
+
+def test_bucket_grants_burst_then_rejects():
+    lim = UpstreamLimiter("t", rate_per_min=1, burst=2)
+    assert _run(lim.acquire(0)) is True
+    assert _run(lim.acquire(0)) is True
+    assert _run(lim.acquire(0)) is False
+    assert lim.granted == 2 and lim.rejected == 1
+
+def test_bucket_waits_for_refill_within_max_wait():
+    lim = UpstreamLimiter("t", rate_per_min=600, burst=1)
+    assert _run(lim.acquire(0)) is True
+    t0 = time.monotonic()
+    assert _run(lim.acquire(1.0)) is True
+    assert 0.05 <= time.monotonic() - t0 < 1.0
+
+def test_429_opens_breaker_and_halves_rate():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5)
+    lim.record_429(30)
+    assert lim.state == "open"
+    assert lim.snapshot()["rate_per_min"] == 30
+    assert _run(lim.acquire(0.1)) is False
+
+def test_half_open_lets_one_probe_through():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+    assert lim.state == "half_open" and lim.probe_inflight
+    assert _run(lim.acquire(0)) is False
+
+def test_probe_success_closes_breaker():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+    lim.record_success()
+    assert lim.state == "closed" and not lim.probe_inflight
+
+def test_probe_failure_allows_another_probe():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+    lim.record_failure()
+    assert _run(lim.acquire(0)) is True
+
+def test_probe_429_reopens_breaker():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+    lim.record_429(5)
+    assert lim.state == "open" and not lim.probe_inflight
+
+def test_abandoned_probe_is_released():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+    lim.record_abandoned()
+    assert _run(lim.acquire(0)) is True
+
+def test_stale_probe_expires():
+    lim = UpstreamLimiter("t", rate_per_min=60, burst=5, probe_timeout_s=0.05)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+    assert _run(lim.acquire(0.5)) is True
+
+def test_cancelled_serp_call_releases_probe(monkeypatch):
+    lim = UpstreamLimiter("serpapi", rate_per_min=60, burst=5)
+    _half_open(lim)
+    monkeypatch.setattr(main, "SERPAPI_LIMITER", lim)
+
+    class _HangingClient:
+        async def get(self, *args, **kwargs):
+            await asyncio.sleep(3600)
+
+    monkeypatch.setattr(main, "get_serp_client", lambda: _HangingClient())
+
+    async def scenario():
+        task = asyncio.create_task(main.search_google_maps("bar roma", 0, refresh=True))
+        await asyncio.sleep(0.05)
+        assert lim.probe_inflight
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return await lim.acquire(0)
+
+    assert _run(scenario()) is True
+
+def test_debug_gemini_does_not_close_half_open_breaker(monkeypatch):
+    lim = UpstreamLimiter("gemini", rate_per_min=60, burst=5)
+    _half_open(lim)
+    assert _run(lim.acquire(0)) is True
+
+    class _Reply:
+        text = "OK"
+
+    class _Model:
+        async def generate_content_async(self, prompt):
+            return _Reply()
+
+    async def get_model():
+        return _Model()
+
+    monkeypatch.setattr(main, "GEMINI_LIMITER", lim)
+    monkeypatch.setattr(main, "get_model", get_model)
+    out = _run(main.debug_gemini())
+    assert out["ok"] is False
+    assert lim.state == "half_open" and lim.probe_inflight
@@ -0,0 +1,7 @@
+import main
+
+def test_label_values_are_escaped():
+    assert main._metric_labels(("k",), ('a\\b"c\nd',)) == '{k="a\\\\b\\"c\\nd"}'
+
+def test_no_labels_renders_nothing():
+    assert main._metric_labels((), ()) == ""
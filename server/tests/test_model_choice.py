@@ -0,0 +1,79 @@
+import asyncio
+
+import main
+
+def test_model_choice_is_read_from_disk_once(monkeypatch):
+    reads = []
+
+    def load():
+        reads.append(1)
+        return "gemini-test", 8192
+
+    monkeypatch.setattr(main, "_load_model_choice", load)
+    monkeypatch.setattr(main, "_MODEL_NAME", None)
+    monkeypatch.setattr(main, "_MODEL_SOURCE", None)
+    monkeypatch.setattr(main, "_MODEL_OUTPUT_LIMIT", None)
+    monkeypatch.setattr(main, "_MODEL_CHOICE_READ", False)
+    assert main._current_model_name() == "gemini-test"
+    assert main._current_model_name() == "gemini-test"
+    assert len(reads) == 1
+    assert main._MODEL_SOURCE == "cache" and main._MODEL_OUTPUT_LIMIT == 8192
+
+def test_missing_model_choice_is_not_reread(monkeypatch):
+    reads = []
+    monkeypatch.setattr(main, "_load_model_choice", lambda: reads.append(1))
+    monkeypatch.setattr(main, "_MODEL_NAME", None)
+    monkeypatch.setattr(main, "_MODEL_CHOICE_READ", False)
+    assert main._current_model_name() is None
+    assert main._current_model_name() is None
+    assert len(reads) == 1
+
+def test_output_tokens_follow_the_model_limit(monkeypatch):
+    monkeypatch.setattr(main, "GEMINI_MAX_OUTPUT_TOKENS", 0)
+    monkeypatch.setattr(main, "_MODEL_OUTPUT_LIMIT", None)
+    assert main._max_output_tokens() == main.GEMINI_DEFAULT_OUTPUT_TOKENS
+    monkeypatch.setattr(main, "_MODEL_OUTPUT_LIMIT", 8192)
+    assert main._max_output_tokens() == 8192
+    monkeypatch.setattr(main, "GEMINI_MAX_OUTPUT_TOKENS", 1000)
+    assert main._max_output_tokens() == 1000
+    monkeypatch.setattr(main, "GEMINI_MAX_OUTPUT_TOKENS", 100000)
+    assert main._max_output_tokens() == 8192
+
+def test_list_models_limit_is_persisted(monkeypatch, tmp_path):
+    class _Model:
+        def __init__(self, name, limit):
+            self.name = name
+            self.output_token_limit = limit
+            self.supported_generation_methods = ["generateContent"]
+
+    class _GenAI:
+        @staticmethod
+        def list_models():
+            return [_Model("models/gemini-pro", 2048), _Model("models/embedding-001", 1)]
+
+        @staticmethod
+        def GenerativeModel(model_name, generation_config):
+            return (model_name, generation_config)
+
+    monkeypatch.setattr(main, "_genai", lambda: _GenAI)
+    monkeypatch.setattr(main, "GEMINI_MODEL_CACHE_PATH", str(tmp_path / "model.json"))
+    monkeypatch.setattr(main, "GEMINI_MAX_OUTPUT_TOKENS", 0)
+    for name in ("_MODEL_OBJ", "_MODEL_NAME", "_MODEL_SOURCE", "_MODEL_OUTPUT_LIMIT"):
+        monkeypatch.setattr(main, name, None)
+    asyncio.run(main.init_model(validate=True))
+    assert main._MODEL_OBJ == ("gemini-pro", {**main.generation_config, "max_output_tokens": 2048})
+    assert main._load_model_choice() == ("gemini-pro", 2048)
+
+def test_non_object_model_cache_is_unreadable(monkeypatch, tmp_path):
+    path = tmp_path / "model.json"
+    monkeypatch.setattr(main, "GEMINI_MODEL_CACHE_PATH", str(path))
+    for content in ('["gemini-pro"]', '"gemini-pro"', "null", "42"):
+        path.write_text(content, encoding="utf-8")
+        assert main._load_model_choice() is None
+
+def test_malformed_model_cache_fields_are_ignored(monkeypatch, tmp_path):
+    path = tmp_path / "model.json"
+    monkeypatch.setattr(main, "GEMINI_MODEL_CACHE_PATH", str(path))
+    monkeypatch.setattr(main, "GEMINI_MODEL", "")
+    path.write_text('{"model": "gemini-pro", "validated_at": "yesterday", "requested": null}', encoding="utf-8")
+    assert main._load_model_choice() is None
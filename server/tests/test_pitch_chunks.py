@@ -0,0 +1,55 @@
+import asyncio
+
+import main
+
+def _items(n):
+    return [{"business_name": f"Biz {k}", "city": "Milano", "category": "Bar"} for k in range(n)]
+
+def test_chunk_budget_follows_model_output_limit(monkeypatch):
+    monkeypatch.setattr(main, "GEMINI_MAX_OUTPUT_TOKENS", 0)
+    monkeypatch.setattr(main, "_MODEL_OUTPUT_LIMIT", 8192)
+    assert len(main._plan_pitch_chunks(_items(main.PITCH_BATCH_MAX_ITEMS))) == 1
+    monkeypatch.setattr(main, "_MODEL_OUTPUT_LIMIT", 2048)
+    assert len(main._plan_pitch_chunks(_items(main.PITCH_BATCH_MAX_ITEMS))) > 1
+
+def test_limiter_rejection_is_not_retried(monkeypatch):
+    calls = []
+
+    async def rejecting(model, items, rid):
+        calls.append(len(items))
+        raise main.GeminiLimiterRejected("gemini limiter closed")
+
+    monkeypatch.setattr(main, "_generate_pitches_uncached", rejecting)
+    before = main.PITCH_CHUNK_STATS["limiter_rejected_items"]
+    out = asyncio.run(main._generate_pitches_chunked(None, _items(5), rid="t"))
+    assert out == [None] * 5
+    assert calls == [5]
+    assert main.PITCH_CHUNK_STATS["limiter_rejected_items"] - before == 5
+
+def test_missing_items_are_retried_once(monkeypatch):
+    calls = []
+
+    async def half(model, items, rid):
+        calls.append(len(items))
+        return ["ok" if k % 2 == 0 else None for k in range(len(items))]
+
+    monkeypatch.setattr(main, "_generate_pitches_uncached", half)
+    asyncio.run(main._generate_pitches_chunked(None, _items(4), rid="t"))
+    assert calls == [4, 2]
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+class _BreakingStreamModel:
+    async def generate_content_async(self, prompt, stream=False):
+        async def chunks():
+            yield _Chunk('[{"i": 0, "sales_pitch": "uno"}, {"i": 1, "sales_')
+            raise RuntimeError("stream reset")
+        return chunks()
+
+def test_broken_stream_keeps_received_pitches(monkeypatch):
+    monkeypatch.setattr(main, "GEMINI_STREAM", True)
+    items = [{**it, "current_status": "NO WEBSITE"} for it in _items(3)]
+    out = asyncio.run(main._generate_pitches_uncached(_BreakingStreamModel(), items, rid="t"))
+    assert out == ["uno", None, None]
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import main
+
+def _collect(limit, per_page_found, sizes):
+    calls = []
+    state = {"left": limit}
+
+    async def fetch(q, start):
+        t0 = time.monotonic()
+        await asyncio.sleep(0.1)
+        calls.append((q, start, t0, time.monotonic()))
+        n = sizes.get((q, start), 20)
+        return {"local_results": [{}] * n}
+
+    async def run():
+        planner = main.SerpFetchPlanner(fetch, [("a", "a"), ("b", "b")], remaining=lambda: state["left"])
+        got = []
+        async for key, start, data in planner.pages():
+            got.append((key, start))
+            state["left"] -= min(state["left"], per_page_found)
+            if state["left"] <= 0:
+                break
+        return got
+
+    return asyncio.run(run()), calls
+
+def test_full_first_page_makes_one_call():
+    got, calls = _collect(20, 20, {})
+    assert got == [("a", 0)]
+    assert len(calls) == 1
+
+def test_sparse_pages_are_prefetched_concurrently():
+    got, calls = _collect(12, 4, {})
+    assert got == [("a", 0), ("a", 20), ("a", 40)]
+    later = {start: (t0, t1) for q, start, t0, t1 in calls if q == "a"}
+    # page 40 was requested while page 20 was still in flight
+    assert later[40][0] < later[20][1]
+
+def test_short_page_ends_the_query_and_yields_in_plan_order():
+    got, calls = _collect(40, 2, {("a", 20): 5})
+    assert [k for k, _ in got][:2] == ["a", "a"]
+    assert ("a", 40) not in got
+    assert got[2][0] == "b"
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import main
+
+def _fake_probe(issues):
+    async def probe(url, host):
+        return {"host": host, "status_code": None, "final_url": None, "issues": list(issues)}
+    return probe
+
+def _expiry(host):
+    return main.PROBE_CACHE._data[host][0] - time.time()
+
+def test_dead_probe_uses_negative_ttl(monkeypatch):
+    monkeypatch.setattr(main, "_probe_host", _fake_probe(["dead"]))
+    main.PROBE_CACHE.clear()
+    asyncio.run(main.probe_website("https://dead.example"))
+    assert _expiry("dead.example") <= main.WEBSITE_PROBE_NEGATIVE_TTL_S
+
+def test_live_probe_uses_full_ttl(monkeypatch):
+    monkeypatch.setattr(main, "_probe_host", _fake_probe(["no_https"]))
+    main.PROBE_CACHE.clear()
+    asyncio.run(main.probe_website("https://live.example"))
+    assert _expiry("live.example") > main.WEBSITE_PROBE_NEGATIVE_TTL_S
+
+def test_probe_deadline_caps_slow_sites(monkeypatch):
+    async def slow_fetch(client, url):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(main, "_probe_fetch", slow_fetch)
+    monkeypatch.setattr(main, "WEBSITE_PROBE_DEADLINE_S", 0.05)
+    t0 = time.monotonic()
+    result = asyncio.run(main._probe_host("https://slow.example", "slow.example"))
+    assert time.monotonic() - t0 < 1
+    assert result["issues"] == ["timeout", "dead"]
+    assert main._status_from_probe(result) == "Dead Website"